@@ -0,0 +1,132 @@
+import asyncio
+import json
+import os
+import threading
+from collections import deque
+from itertools import islice
+
+
+def format_event(event, data, event_id=None):
+    """Encode one Server-Sent Events message"""
+    lines = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{lines}event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n".encode()
+
+
+class Broadcaster:
+    """Fans events out to any number of stream subscribers at a constant publish cost.
+
+    Each event is serialized once into a bounded ring shared by all subscribers, which read it at
+    their own pace through a private cursor. A subscriber falling more than `capacity` events behind
+    (a slow client) skips to the oldest retained event and is sent a 'lagged' event, so slow clients
+    never hold memory or block the ingestion path. Subscribers wait on one shared event per publish
+    (and one future per event loop), so publishing does not touch individual subscribers.
+    """
+    def __init__(self, capacity=None, heartbeat=None):
+        self.capacity = capacity or int(os.getenv('STREAM_BUFFER', 64))
+        self.heartbeat = heartbeat or int(os.getenv('STREAM_HEARTBEAT', 15))  # Seconds between keep-alives
+        self._messages = deque(maxlen=self.capacity)
+        self._next_id = 0       # Id of the next published event; ids index the ring
+        self._subscribers = 0
+        self._lock = threading.Lock()
+        self._published = threading.Event()    # Set (and replaced) on every publish
+        self._futures = {}      # Event loop -> future resolved on the next publish
+
+    @property
+    def subscriber_count(self):
+        """Return the number of open streams"""
+        return self._subscribers
+
+    def publish(self, event, data):
+        """Append an event for every subscriber"""
+        with self._lock:
+            self._messages.append(format_event(event, data, self._next_id))
+            self._next_id += 1
+            published, self._published = self._published, threading.Event()
+            futures, self._futures = self._futures, {}
+        published.set()
+        for loop, future in futures.items():
+            loop.call_soon_threadsafe(_resolve, future)
+
+    def stream(self, last_event_id=None, first=None):
+        """Yield SSE messages until the client disconnects (blocking; for threaded servers)"""
+        cursor = self._subscribe(last_event_id)
+        try:
+            if first:
+                yield first
+            while True:
+                messages, cursor = self._read(cursor)
+                if messages:
+                    yield b"".join(messages)
+                elif not self._wait(cursor):
+                    yield b": keep-alive\n\n"
+        finally:
+            self._unsubscribe()
+
+    async def stream_async(self, last_event_id=None, first=None):
+        """Asyncio variant of stream()"""
+        cursor = self._subscribe(last_event_id)
+        try:
+            if first:
+                yield first
+            while True:
+                messages, cursor = self._read(cursor)
+                if messages:
+                    yield b"".join(messages)
+                elif not await self._wait_async(cursor):
+                    yield b": keep-alive\n\n"
+        finally:
+            self._unsubscribe()
+
+    def _subscribe(self, last_event_id):
+        """Register a subscriber; returns its starting cursor (resuming after Last-Event-ID if given)"""
+        with self._lock:
+            self._subscribers += 1
+            try:
+                cursor = int(last_event_id) + 1
+            except (TypeError, ValueError):
+                cursor = self._next_id
+            return min(max(cursor, 0), self._next_id)
+
+    def _unsubscribe(self):
+        with self._lock:
+            self._subscribers -= 1
+
+    def _read(self, cursor):
+        """Return (messages from cursor on, new cursor), noting events lost to overflow"""
+        with self._lock:
+            oldest = self._next_id - len(self._messages)
+            messages = []
+            if cursor < oldest:
+                messages.append(format_event('lagged', {'missed': oldest - cursor}))
+                cursor = oldest
+            messages.extend(islice(self._messages, cursor - oldest, None))
+            return messages, self._next_id
+
+    def _wait(self, cursor):
+        """Block until an event after cursor is published; False on heartbeat timeout"""
+        with self._lock:
+            if self._next_id > cursor:
+                return True
+            published = self._published
+        return published.wait(self.heartbeat)
+
+    async def _wait_async(self, cursor):
+        """Await an event after cursor; False on heartbeat timeout"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._next_id > cursor:
+                return True
+            future = self._futures.get(loop)
+            if future is None:
+                future = self._futures[loop] = loop.create_future()
+        try:
+            # Shielded: the future is shared by every subscriber on this loop
+            await asyncio.wait_for(asyncio.shield(future), self.heartbeat)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
@@ -0,0 +1,100 @@
+import threading
+import numpy as np
+
+# Column order of the value arrays; matches the feature order used by the models
+READING_FIELDS = ('temperature', 'humidity', 'pressure')
+
+
+class WeatherDataStore:
+    """Fixed-capacity ring buffer of readings kept in typed NumPy arrays.
+
+    Writers are serialized by a lock; readers take snapshots under the same lock. Views of a snapshot
+    can be overwritten by later writes, so readers that need stable data take copies.
+    """
+    def __init__(self, capacity=8760):
+        self.capacity = capacity
+        # Every reading is written twice (at slot i and i + capacity) so that the latest
+        # n readings always form one contiguous slice and can be handed out as a view
+        self._timestamps = np.zeros(2 * capacity, dtype='datetime64[s]')
+        self._values = np.zeros((2 * capacity, len(READING_FIELDS)), dtype=np.float64)
+        self._next = 0      # Slot the next reading is written to
+        self._size = 0
+        self.version = 0    # Incremented whenever the contents change
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._size
+
+    def is_full(self):
+        """Return True once appending starts evicting the oldest readings"""
+        return self._size == self.capacity
+
+    def append(self, timestamp, temperature, humidity, pressure):
+        """Append one reading, evicting the oldest one when the buffer is full"""
+        ts = np.datetime64(timestamp, 's')
+        row = (temperature, humidity, pressure)
+        with self._lock:
+            slot = self._next
+            self._timestamps[slot] = self._timestamps[slot + self.capacity] = ts
+            self._values[slot] = self._values[slot + self.capacity] = row
+            self._next = (slot + 1) % self.capacity
+            self._size = min(self._size + 1, self.capacity)
+            self.version += 1
+
+    def replace(self, timestamps, values):
+        """Atomically replace the contents with the given readings"""
+        with self._lock:
+            # Keep writing after the current position: a short replacement leaves recent views intact,
+            # but one of about `capacity` rows overwrites every slot
+            self._size = 0
+            self._extend(timestamps, values)
+            self.version += 1
+
+    def _extend(self, timestamps, values):
+        """Write readings after the newest one; the caller holds the lock"""
+        timestamps = np.asarray(timestamps, dtype='datetime64[s]')
+        values = np.asarray(values, dtype=np.float64).reshape(-1, len(READING_FIELDS))
+        if len(timestamps) == 0:
+            return
+        # Only the last `capacity` readings can survive anyway
+        timestamps = timestamps[-self.capacity:]
+        values = values[-self.capacity:]
+
+        slots = (self._next + np.arange(len(timestamps))) % self.capacity
+        self._timestamps[slots] = self._timestamps[slots + self.capacity] = timestamps
+        self._values[slots] = self._values[slots + self.capacity] = values
+        self._next = int((slots[-1] + 1) % self.capacity)
+        self._size = min(self._size + len(timestamps), self.capacity)
+        self.version += 1
+
+    def snapshot(self, n=None, copy=False):
+        """Return (version, timestamps, values) for the latest n readings, oldest first.
+
+        Without copy the arrays are read-only views that stay valid until roughly `capacity - n`
+        further readings are written or the store is replaced; with copy they are private and never change.
+        """
+        with self._lock:
+            n = self._size if n is None else min(n, self._size)
+            end = self._next + self.capacity
+            version = self.version
+            timestamps = self._timestamps[end - n:end]
+            values = self._values[end - n:end]
+            if copy:
+                timestamps = timestamps.copy()
+                values = values.copy()
+        timestamps.flags.writeable = False
+        values.flags.writeable = False
+        return version, timestamps, values
+
+    def latest(self):
+        """Return the newest reading as a dict, or None if the store is empty"""
+        with self._lock:
+            if self._size == 0:
+                return None
+            slot = self._next + self.capacity - 1
+            timestamp = self._timestamps[slot]
+            row = self._values[slot].copy()
+        reading = {'created_at': str(timestamp).replace('T', ' ')}
+        for field, value in zip(READING_FIELDS, row):
+            reading[field] = float(value)
+        return reading
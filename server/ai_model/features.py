@@ -0,0 +1,126 @@
+import threading
+import numpy as np
+from ai_model.data_store import READING_FIELDS
+
+LAG_HOURS = 24          # Longest lag, also the length of the rolling mean
+HOURLY_WINDOW = LAG_HOURS + 1   # Hourly values needed for one feature row: t - 24 .. t
+HOURLY_FEATURES = (
+    list(READING_FIELDS)
+    + [f'{field}_change_1h' for field in READING_FIELDS]
+    + [f'{field}_change_24h' for field in READING_FIELDS]
+    + [f'{field}_mean_24h' for field in READING_FIELDS]
+    + ['hour_sin', 'hour_cos', 'day_of_year_sin', 'day_of_year_cos']
+)
+
+
+def feature_rows(current, lag_1h, lag_24h, mean_24h, hours):
+    """Build hourly model feature rows from (m, 3) value arrays and the (m,) datetime64[h] hour of each row"""
+    days = hours.astype('datetime64[D]')
+    hour_angle = 2 * np.pi * (hours - days).astype(np.float64) / 24
+    day_angle = 2 * np.pi * (days - days.astype('datetime64[Y]')).astype(np.float64) / 365.25
+    return np.column_stack([
+        current,
+        current - lag_1h,
+        current - lag_24h,
+        mean_24h,
+        np.sin(hour_angle), np.cos(hour_angle),
+        np.sin(day_angle), np.cos(day_angle)
+    ])
+
+
+def hourly_series(timestamps, values):
+    """Resample readings to a gap-free hourly series: the mean of each hour, gaps filled with the previous hour.
+
+    Returns (hours, series) as datetime64[h] and (hours, 3) float64 arrays.
+    """
+    if len(timestamps) == 0:
+        return np.empty(0, dtype='datetime64[h]'), np.empty((0, len(READING_FIELDS)))
+    hours = np.asarray(timestamps).astype('datetime64[h]')
+    order = np.argsort(hours, kind='stable')
+    hours = hours[order]
+    values = np.asarray(values, dtype=np.float64)[order]
+
+    unique, starts, counts = np.unique(hours, return_index=True, return_counts=True)
+    means = np.add.reduceat(values, starts, axis=0) / counts[:, None]
+
+    grid = np.arange(unique[0], unique[-1] + 1)
+    # Index of the latest hour with readings at or before each grid hour
+    present = np.searchsorted(unique, grid, side='right') - 1
+    return grid, means[present]
+
+
+def training_matrix(timestamps, values, max_hours=None):
+    """Build (X, Y) for the hourly model: features at hour t, and the change from t to t + 1 as target"""
+    hours, series = hourly_series(timestamps, values)
+    if max_hours is not None:
+        hours, series = hours[-max_hours:], series[-max_hours:]
+    t = np.arange(LAG_HOURS, len(series) - 1)
+    if len(t) == 0:
+        return np.empty((0, len(HOURLY_FEATURES))), np.empty((0, len(READING_FIELDS)))
+
+    cumulative = np.concatenate([np.zeros((1, series.shape[1])), np.cumsum(series, axis=0)])
+    mean_24h = (cumulative[t + 1] - cumulative[t + 1 - LAG_HOURS]) / LAG_HOURS
+    X = feature_rows(series[t], series[t - 1], series[t - LAG_HOURS], mean_24h, hours[t])
+    return X, series[t + 1] - series[t]
+
+
+class HourlyFeatureState:
+    """The latest HOURLY_WINDOW hourly means of a location's readings, kept up to date in O(1) per reading.
+
+    Completed hours sit in a fixed window; the current hour is accumulated as a running sum until a
+    reading from a later hour closes it. This is what the hourly forecast starts from, so serving
+    never resamples the history.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._window = np.full((HOURLY_WINDOW - 1, len(READING_FIELDS)), np.nan)    # Completed hours, oldest first
+        self._hour = None   # datetime64[h] being accumulated
+        self._sum = np.zeros(len(READING_FIELDS))
+        self._count = 0
+
+    def update(self, timestamp, values):
+        """Add one reading"""
+        hour = np.datetime64(timestamp, 'h')
+        with self._lock:
+            if self._hour is not None and hour < self._hour:
+                return  # Out-of-order reading; the hour it belongs to is already closed
+            if self._hour is not None and hour > self._hour:
+                # Close the current hour; skipped hours repeat it, as in hourly_series
+                steps = min(int((hour - self._hour).astype(np.int64)), len(self._window))
+                closed = np.repeat((self._sum / self._count)[None, :], steps, axis=0)
+                self._window = np.concatenate([self._window[steps:], closed])
+                self._sum = np.zeros(len(READING_FIELDS))
+                self._count = 0
+            self._hour = hour
+            self._sum += np.asarray(values, dtype=np.float64)
+            self._count += 1
+
+    def reset(self, timestamps, values):
+        """Rebuild from chronological readings, e.g. after the store was replaced; only the last two days are read"""
+        timestamps = np.asarray(timestamps)
+        with self._lock:
+            self._window[:] = np.nan
+            self._hour = None
+            self._sum = np.zeros(len(READING_FIELDS))
+            self._count = 0
+            if len(timestamps) == 0:
+                return
+            last_hour = timestamps[-1].astype('datetime64[h]')
+            # Read a day more than the window so that gaps at its start are filled as in hourly_series
+            start = np.searchsorted(timestamps, (last_hour - 2 * HOURLY_WINDOW).astype(timestamps.dtype))
+            hours, series = hourly_series(timestamps[start:], values[start:])
+            completed = series[:-1][-len(self._window):]
+            if len(completed):
+                self._window[-len(completed):] = completed
+            in_hour = timestamps[start:].astype('datetime64[h]') == last_hour
+            self._hour = last_hour
+            self._sum = np.asarray(values[start:][in_hour], dtype=np.float64).sum(axis=0)
+            self._count = int(in_hour.sum())
+
+    def snapshot(self):
+        """Return (hour, window): the current hour and the (HOURLY_WINDOW, 3) hourly values ending with it,
+        or None until a full day of history is available"""
+        with self._lock:
+            if self._hour is None or np.isnan(self._window).any():
+                return None
+            return self._hour, np.concatenate([self._window, (self._sum / self._count)[None, :]])
@@ -0,0 +1,69 @@
+import numpy as np
+
+TREE_LEAF = -1  # scikit-learn's child index for leaves
+
+
+class FlatForest:
+    """A fitted RandomForestRegressor flattened into contiguous node arrays for fast inference.
+
+    All trees share one set of arrays and are walked together with vectorized gathers, so predicting
+    a few rows costs a couple of dozen NumPy operations instead of one scikit-learn call per tree.
+    Predictions match RandomForestRegressor.predict exactly: inputs are cast to float32 as scikit-learn
+    does, and the tree outputs are summed in estimator order before averaging.
+    """
+    def __init__(self, forest):
+        trees = [estimator.tree_ for estimator in forest.estimators_]
+        offsets = np.cumsum([0] + [tree.node_count for tree in trees[:-1]])
+
+        left, right, feature, threshold = [], [], [], []
+        for tree, offset in zip(trees, offsets):
+            nodes = np.arange(tree.node_count) + offset
+            leaf = tree.children_left == TREE_LEAF
+            # Leaves point to themselves with an infinite threshold, so extra traversal steps stay put
+            left.append(np.where(leaf, nodes, tree.children_left + offset))
+            right.append(np.where(leaf, nodes, tree.children_right + offset))
+            feature.append(np.where(leaf, 0, tree.feature))
+            threshold.append(np.where(leaf, np.inf, tree.threshold))
+
+        self.roots = offsets.astype(np.intp)    # Index of each tree's root node
+        self.left = np.concatenate(left).astype(np.intp)
+        self.right = np.concatenate(right).astype(np.intp)
+        self.feature = np.concatenate(feature).astype(np.intp)
+        self.threshold = np.concatenate(threshold).astype(np.float64)
+        self.value = np.concatenate([tree.value[:, :, 0] for tree in trees])  # (nodes, outputs) float64
+        self.max_depth = max(tree.max_depth for tree in trees)
+        self.n_features_in_ = forest.n_features_in_
+        self.n_outputs_ = forest.n_outputs_
+
+    def __setstate__(self, state):
+        # Artifacts loaded with mmap_mode hand out np.memmap arrays, whose indexing goes through Python
+        # hooks; plain ndarray views keep the file-backed memory without that overhead
+        self.__dict__.update({
+            name: np.asarray(value) if isinstance(value, np.ndarray) else value for name, value in state.items()
+        })
+
+    @property
+    def nbytes(self):
+        """Memory held by the node arrays"""
+        return sum(array.nbytes for array in (self.roots, self.left, self.right, self.feature, self.threshold, self.value))
+
+    def predict(self, X):
+        """Predict like RandomForestRegressor.predict: shape (n,) for one output, (n, outputs) otherwise"""
+        # scikit-learn compares float32 inputs against the float64 thresholds
+        X = np.asarray(X, dtype=np.float32).reshape(-1, self.n_features_in_)
+        rows = np.arange(len(X))[:, None]
+
+        # Walk every (row, tree) pair one level per step; rows that reached a leaf stay on it
+        nodes = np.broadcast_to(self.roots, (len(X), len(self.roots)))
+        for _ in range(self.max_depth):
+            go_left = X[rows, self.feature[nodes]] <= self.threshold[nodes]
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+
+        # cumsum adds the trees one after another, in the same order as scikit-learn's accumulation
+        prediction = np.cumsum(self.value[nodes], axis=1)[:, -1] / len(self.roots)
+        return prediction[:, 0] if self.n_outputs_ == 1 else prediction
+
+
+def compile_forests(forests):
+    """Flatten fitted forests for inference with predict_forests"""
+    return [FlatForest(forest) for forest in forests]
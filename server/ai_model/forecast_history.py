@@ -0,0 +1,90 @@
+import json
+import os
+import threading
+from collections import deque
+
+
+class ForecastHistory:
+    """Bounded log of materialized forecasts, kept as JSON lines in a location's data directory.
+
+    Each entry records a served forecast with the model and data versions it was computed from, so
+    forecasts can be checked against the readings that arrive later. The newest `capacity` entries are
+    kept and the file is compacted once it holds twice as many. Follower worker processes only read the
+    owner's file, reloading it when it changes.
+    """
+    def __init__(self, data_dir, capacity=None):
+        self.path = os.path.join(data_dir, "forecast_history.jsonl")
+        self.capacity = capacity or int(os.getenv('FORECAST_HISTORY', 336))
+        self._entries = deque(maxlen=self.capacity)
+        self._lines = 0         # Lines in the file, including those beyond capacity
+        self._mtime = None      # mtime of the file as last read or written
+        self._version = 0       # Bumped whenever the entries change
+        self._lock = threading.Lock()
+
+    def append(self, entry):
+        """Add a forecast entry (a JSON-serializable dict) to the history"""
+        line = json.dumps(entry, separators=(',', ':')) + '\n'
+        with self._lock:
+            self._reload()
+            self._entries.append(entry)
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            if self._lines >= 2 * self.capacity:
+                self._rewrite()
+            else:
+                with open(self.path, 'a') as f:
+                    f.write(line)
+                self._lines += 1
+            self._mtime = self._stat()
+            self._version += 1
+
+    def recent(self, limit=None):
+        """Return up to `limit` entries, newest first"""
+        with self._lock:
+            self._reload()
+            entries = list(self._entries)
+        entries.reverse()
+        return entries[:limit] if limit else entries
+
+    def version(self):
+        """Return a number that changes whenever the entries do, including appends by the owner process"""
+        with self._lock:
+            self._reload()
+            return self._version
+
+    def __len__(self):
+        with self._lock:
+            self._reload()
+            return len(self._entries)
+
+    def _reload(self):
+        """Read the file again if another process (or a previous run) wrote it"""
+        mtime = self._stat()
+        if mtime == self._mtime:
+            return
+        entries = deque(maxlen=self.capacity)
+        lines = 0
+        if mtime is not None:
+            with open(self.path) as f:
+                for line in f:
+                    lines += 1
+                    try:
+                        entries.append(json.loads(line))
+                    except ValueError:
+                        continue    # Torn line of an interrupted write
+        self._entries, self._lines, self._mtime = entries, lines, mtime
+        self._version += 1
+
+    def _rewrite(self):
+        """Replace the file with the kept entries; readers see either the old or the new file"""
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            for entry in self._entries:
+                f.write(json.dumps(entry, separators=(',', ':')) + '\n')
+        os.replace(tmp_path, self.path)
+        self._lines = len(self._entries)
+
+    def _stat(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return None
@@ -0,0 +1,172 @@
+import hashlib
+import numpy as np
+from datetime import datetime
+from ai_model.features import LAG_HOURS, feature_rows
+
+FORECAST_DAYS = 7
+HOURLY_FORECAST_HOURS = 168     # 7 days of hourly steps
+
+
+def day_night_scales(hour):
+    """Return the (min, max) temperature spread factors for the hour the forecast is made at"""
+    # Day is considered from 6 AM to 6 PM (12 hours)
+    # Night is considered from 6 PM to 6 AM (12 hours)
+    if 6 <= hour < 18:  # Day time
+        return 2, 0.5
+    return 0.5, 2   # Night time
+
+
+def forecast_seed(model_version, data_version):
+    """Seed of a forecast's day-to-day variation, fixed for a model and the readings it is applied to"""
+    return int(hashlib.sha1(f"{model_version}:{data_version}".encode()).hexdigest()[:8], 16)
+
+
+def standard_noise(count, days, seed=None):
+    """Standard normal (count, days, 3) draws; seed is one seed for all requests or a sequence of one per request.
+
+    With per-request seeds each request gets the same draws whatever it is batched with, and a shorter
+    horizon gets the first days of a longer one.
+    """
+    if seed is None or np.isscalar(seed):
+        return np.random.default_rng(seed).standard_normal((count, days, 3))
+    return np.stack([np.random.default_rng(request_seed).standard_normal((days, 3)) for request_seed in seed])
+
+
+def daily_forecast_arrays(predicted, variations, noise, hour):
+    """Turn base predictions into daily forecasts for many requests at once.
+
+    predicted and variations are (m, 3) arrays of [temperature, humidity, pressure] and noise an
+    (m, days, 3) array of standard normal draws; returns a dict of (m, days) arrays keyed by forecast field.
+    """
+    # Random day-to-day variation around the base prediction: 20% of the historical spread
+    daily = predicted[:, None, :] + noise * (variations * 0.2)[:, None, :]
+
+    # Apply day/night variations to min and max temperatures
+    min_scale, max_scale = day_night_scales(hour)
+    temp_variation = variations[:, 0:1]
+    return {
+        'min_temperature': daily[..., 0] - temp_variation * min_scale,
+        'max_temperature': daily[..., 0] + temp_variation * max_scale,
+        'humidity': np.clip(daily[..., 1], 0, 100),    # Ensure humidity stays within valid range
+        'pressure': daily[..., 2]
+    }
+
+
+FORECAST_FIELDS = ('min_temperature', 'max_temperature', 'humidity', 'pressure')
+
+
+def forecast_columns(models, base_rows, variations, days=FORECAST_DAYS, seed=None, now=None):
+    """Forecast many requests (locations or scenarios) in one pass, column by column.
+
+    models, base_rows and variations hold one entry per request; requests sharing a model are
+    predicted with a single model call. seed is passed to standard_noise. Returns (dates, columns):
+    the forecast dates as strings and a dict of (requests, days) arrays rounded to 2 decimals, keyed by
+    forecast field.
+    """
+    base_rows = np.asarray(base_rows, dtype=np.float64).reshape(-1, 3)
+    variations = np.asarray(variations, dtype=np.float64).reshape(-1, 3)
+    now = now or datetime.now()
+
+    # One model call per distinct model
+    predicted = np.empty_like(base_rows)
+    groups = {}
+    for index, model in enumerate(models):
+        groups.setdefault(id(model), (model, []))[1].append(index)
+    for model, rows in groups.values():
+        predicted[rows] = model.predict(base_rows[rows])
+
+    arrays = daily_forecast_arrays(predicted, variations, standard_noise(len(base_rows), days, seed), now.hour)
+    dates = np.datetime_as_string(np.datetime64(now.date()) + np.arange(days)).tolist()
+    return dates, {field: np.round(values, 2) for field, values in arrays.items()}
+
+
+def forecast_records(dates, columns, row):
+    """Return the daily forecast dicts for one row of forecast columns (converted with tolist())"""
+    return [
+        {'date': date, **{field: columns[field][row][day] for field in FORECAST_FIELDS}}
+        for day, date in enumerate(dates)
+    ]
+
+
+def predict_forecasts(models, base_rows, variations, days=FORECAST_DAYS, seed=None, now=None):
+    """Like forecast_columns, but returns one list of daily forecast dicts per request"""
+    dates, arrays = forecast_columns(models, base_rows, variations, days, seed, now)
+    columns = {field: values.tolist() for field, values in arrays.items()}
+    return [forecast_records(dates, columns, row) for row in range(len(models))]
+
+
+def forecast_locations_columns(predictors, days=FORECAST_DAYS, seed=None):
+    """Forecast several locations in one batched pass, returning (models, dates, columns).
+
+    models has one entry per predictor, None where no model is available; columns holds one row per
+    predictor, NaN for those without a model. Without a seed each location uses its forecast seed, so
+    its forecast matches the one materialized for /api/weather-forecast.
+    """
+    ready = []
+    for index, predictor in enumerate(predictors):
+        if len(predictor.store) < 240:   # Too little data to train on
+            continue
+        model = predictor.model_registry.get_latest()
+        if model is not None:
+            base_row, variation = predictor.forecast_inputs()
+            ready.append((index, model, base_row, variation, predictor.forecast_seed(model)))
+
+    models = [None] * len(predictors)
+    dates = np.datetime_as_string(np.datetime64(datetime.now().date()) + np.arange(days)).tolist()
+    columns = {field: np.full((len(predictors), days), np.nan) for field in FORECAST_FIELDS}
+    if ready:
+        indexes, ready_models, base_rows, variations, seeds = zip(*ready)
+        dates, arrays = forecast_columns(ready_models, base_rows, variations, days, seeds if seed is None else seed)
+        indexes = list(indexes)
+        for field, values in arrays.items():
+            columns[field][indexes] = values
+        for index, model in zip(indexes, ready_models):
+            models[index] = model
+    return models, dates, columns
+
+
+def forecast_hourly_arrays(models, windows, hours, steps=HOURLY_FORECAST_HOURS):
+    """Roll the hourly models forward `steps` hours for many requests at once.
+
+    windows is an (m, HOURLY_WINDOW, 3) array of the latest hourly values (oldest first) and hours the
+    (m,) datetime64[h] of their last row. Each step predicts the change to the next hour and feeds it
+    back, updating the lags and the rolling sum instead of recomputing them. Returns an (m, steps, 3) array.
+    """
+    window = np.array(windows, dtype=np.float64)
+    hours = np.asarray(hours, dtype='datetime64[h]')
+    rolling_sum = window[:, 1:].sum(axis=1)     # Sum of the last LAG_HOURS hours
+    groups = {}
+    for index, model in enumerate(models):
+        groups.setdefault(id(model), (model, []))[1].append(index)
+
+    out = np.empty((len(window), steps, window.shape[2]))
+    change = np.empty((len(window), window.shape[2]))
+    for step in range(steps):
+        current = window[:, -1]
+        X = feature_rows(current, window[:, -2], window[:, 0], rolling_sum / LAG_HOURS, hours + step)
+        for model, rows in groups.values():
+            change[rows] = model.predict_hourly(X[rows])
+        following = current + change
+        following[:, 1] = np.clip(following[:, 1], 0, 100)     # Humidity stays within its valid range
+        rolling_sum += following - window[:, 1]
+        window = np.concatenate([window[:, 1:], following[:, None, :]], axis=1)
+        out[:, step] = following
+    return out
+
+
+def forecast_hourly(models, windows, hours, steps=HOURLY_FORECAST_HOURS):
+    """Like forecast_hourly_arrays, but returns one list of hourly forecast dicts per request"""
+    values = np.round(forecast_hourly_arrays(models, windows, hours, steps), 2).tolist()
+    times = np.datetime_as_string(np.asarray(hours, dtype='datetime64[h]')[:, None] + np.arange(1, steps + 1), unit='m')
+    return [
+        [
+            {
+                'time': times[request][step],
+                'temperature': values[request][step][0],
+                'humidity': values[request][step][1],
+                'pressure': values[request][step][2]
+            }
+            for step in range(steps)
+        ]
+        for request in range(len(values))
+    ]
@@ -0,0 +1,156 @@
+import os
+import threading
+from contextlib import contextmanager
+import numpy as np
+
+# On-disk layout: two headerless little-endian files that grow together, one row per hourly reading
+#   history_timestamps.bin  int64 seconds since the Unix epoch
+#   history_values.bin      float64 [temperature, humidity, pressure] rows
+TIMESTAMP_DTYPE = np.dtype('<i8')
+VALUE_DTYPE = np.dtype('<f8')
+VALUE_COLUMNS = 3
+
+_directory_locks = {}   # Absolute directory -> lock shared by every HistoryFile of that directory in the process
+_directory_locks_guard = threading.Lock()
+
+
+def _directory_lock(directory):
+    with _directory_locks_guard:
+        return _directory_locks.setdefault(os.path.abspath(directory), threading.Lock())
+
+
+class HistoryFile:
+    """Append-friendly binary history of readings that loads as memory-mapped, zero-copy arrays.
+
+    The two column files cannot be replaced together atomically, so reads and writes hold the
+    directory's history lock: within the process and, where flock exists, across processes. Arrays
+    returned by read() stay consistent afterwards, since a rewrite replaces the files rather than
+    changing them in place.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        self.timestamps_path = os.path.join(directory, "history_timestamps.bin")
+        self.values_path = os.path.join(directory, "history_values.bin")
+        self.lock_path = os.path.join(directory, ".history.lock")
+
+    @contextmanager
+    def _locked(self, exclusive=False):
+        """Hold the history lock; readers share the cross-process lock, writers take it exclusively"""
+        with _directory_lock(self.directory):
+            try:
+                import fcntl  # POSIX only; elsewhere only threads of this process are serialized
+            except ImportError:
+                yield
+                return
+            if not exclusive and not os.path.isdir(self.directory):
+                yield   # Nothing written yet, so nothing to read consistently
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+                yield
+            finally:
+                os.close(fd)    # Releases the flock
+
+    def exists(self):
+        """Return True if a history has been written"""
+        return os.path.exists(self.timestamps_path) and os.path.exists(self.values_path)
+
+    def __len__(self):
+        if not self.exists():
+            return 0
+        # A crash between the two appends can leave one file longer; the shorter one wins
+        return min(os.path.getsize(self.timestamps_path) // TIMESTAMP_DTYPE.itemsize,
+                   os.path.getsize(self.values_path) // (VALUE_DTYPE.itemsize * VALUE_COLUMNS))
+
+    def read(self, n=None):
+        """Return (timestamps, values) of the latest n rows as read-only memory-mapped views"""
+        with self._locked():
+            return self._read(n)
+
+    def _read(self, n=None):
+        rows = len(self)
+        n = rows if n is None else min(n, rows)
+        if n == 0:
+            return np.empty(0, dtype='datetime64[s]'), np.empty((0, VALUE_COLUMNS), dtype=VALUE_DTYPE)
+
+        timestamps = np.memmap(self.timestamps_path, dtype=TIMESTAMP_DTYPE, mode='r', shape=(rows,))
+        values = np.memmap(self.values_path, dtype=VALUE_DTYPE, mode='r', shape=(rows, VALUE_COLUMNS))
+        return timestamps[rows - n:].view('datetime64[s]'), values[rows - n:]
+
+    def append(self, timestamps, values):
+        """Append rows to the end of the history"""
+        with self._locked(exclusive=True):
+            self._append(timestamps, values)
+
+    def _append(self, timestamps, values):
+        timestamps, values = self._encode(timestamps, values)
+        os.makedirs(self.directory, exist_ok=True)
+        # Trim a torn tail first so both files keep the same number of rows
+        rows = len(self)
+        for path, row_size in ((self.timestamps_path, TIMESTAMP_DTYPE.itemsize),
+                               (self.values_path, VALUE_DTYPE.itemsize * VALUE_COLUMNS)):
+            if os.path.exists(path) and os.path.getsize(path) != rows * row_size:
+                os.truncate(path, rows * row_size)
+        with open(self.timestamps_path, 'ab') as f:
+            f.write(timestamps.tobytes())
+        with open(self.values_path, 'ab') as f:
+            f.write(values.tobytes())
+
+    def write(self, timestamps, values):
+        """Replace the whole history; readers holding the lock see either the old or the new files"""
+        with self._locked(exclusive=True):
+            self._write(timestamps, values)
+
+    def _write(self, timestamps, values):
+        timestamps, values = self._encode(timestamps, values)
+        os.makedirs(self.directory, exist_ok=True)
+        for path, array in ((self.timestamps_path, timestamps), (self.values_path, values)):
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(array.tobytes())
+            os.replace(tmp_path, path)
+
+    def merge(self, timestamps, values):
+        """Add rows whose timestamps are not stored yet; returns the number of rows added.
+
+        Rows newer than the last stored one are appended; backfilled rows inside the stored range
+        trigger a sorted rewrite, which only happens when gaps are filled.
+        """
+        timestamps = np.asarray(timestamps, dtype='datetime64[s]')
+        values = np.asarray(values, dtype=VALUE_DTYPE).reshape(-1, VALUE_COLUMNS)
+        with self._locked(exclusive=True):
+            return self._merge(timestamps, values)
+
+    def _merge(self, timestamps, values):
+        stored_timestamps, stored_values = self._read()
+
+        # Deduplicate against the stored rows and within the new rows
+        new = ~np.isin(timestamps, stored_timestamps)
+        timestamps, first = np.unique(timestamps[new], return_index=True)
+        values = values[new][first]
+        if len(timestamps) == 0:
+            return 0
+
+        if len(stored_timestamps) == 0 or timestamps[0] > stored_timestamps[-1]:
+            self._append(timestamps, values)
+        else:
+            all_timestamps = np.concatenate([stored_timestamps, timestamps])
+            order = np.argsort(all_timestamps, kind='stable')
+            self._write(all_timestamps[order], np.concatenate([stored_values, values])[order])
+        return len(timestamps)
+
+    def missing_hours(self, start, end):
+        """Return the hourly timestamps in [start, end] that are not stored"""
+        expected = np.arange(np.datetime64(start, 'h'), np.datetime64(end, 'h') + 1).astype('datetime64[s]')
+        stored_timestamps, _ = self.read()
+        return expected[~np.isin(expected, stored_timestamps)]
+
+    def _encode(self, timestamps, values):
+        """Convert readings to the on-disk dtypes"""
+        timestamps = np.asarray(timestamps, dtype='datetime64[s]').astype(TIMESTAMP_DTYPE)
+        values = np.ascontiguousarray(values, dtype=VALUE_DTYPE).reshape(-1, VALUE_COLUMNS)
+        if len(timestamps) != len(values):
+            raise ValueError(f"got {len(timestamps)} timestamps for {len(values)} value rows")
+        return timestamps, values
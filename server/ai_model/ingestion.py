@@ -0,0 +1,62 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class IngestionScheduler:
+    """Calls a refresh function on a fixed cadence, in a background thread, the foreground or an event loop"""
+    def __init__(self, refresh, interval=None):
+        self.refresh = refresh  # Callable doing one round of ingestion
+        self.interval = interval or int(os.getenv('INGEST_INTERVAL', 300))  # Seconds between refreshes
+        self.last_run = None    # time.time() of the last completed refresh
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def stale_after(self):
+        """Age in seconds after which a reading is reported as stale (two missed refreshes)"""
+        return 2 * self.interval
+
+    def tick(self):
+        """Run one refresh, keeping the schedule alive if it fails"""
+        try:
+            self.refresh()
+        except Exception as e:
+            logger.error("Error in ingestion refresh: %s", e)
+        self.last_run = time.time()
+
+    def run_forever(self):
+        """Refresh every `interval` seconds until stop() is called; the schedule does not drift"""
+        next_run = time.monotonic() + self.interval
+        while not self._stop.wait(max(0, next_run - time.monotonic())):
+            self.tick()
+            next_run += self.interval
+            # Skip missed slots if a refresh overran the interval
+            if next_run < time.monotonic():
+                next_run = time.monotonic() + self.interval
+
+    async def run_async(self):
+        """Asyncio variant of run_forever() for a refresh coroutine function"""
+        while not self._stop.is_set():
+            await asyncio.sleep(self.interval)
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.error("Error in ingestion refresh: %s", e)
+            self.last_run = time.time()
+
+    def start(self):
+        """Start refreshing in a daemon thread"""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self.run_forever, daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop the refresh loop"""
+        self._stop.set()
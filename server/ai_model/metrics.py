@@ -0,0 +1,187 @@
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'  # Prometheus text exposition format
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+TRAINING_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+
+def _format_value(value):
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    """A named metric with a fixed set of label names, holding one child per label combination"""
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}     # Label values tuple -> child state
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _labels(self, key, extra=()):
+        return tuple(zip(self.labelnames, key)) + tuple(extra)
+
+    @property
+    def family(self):
+        """Name of the metric family in the exposition"""
+        return self.name
+
+    def render(self):
+        lines = [f"# HELP {self.family} {self.documentation}", f"# TYPE {self.family} {self.kind}"]
+        with self._lock:
+            children = sorted(self._children.items())
+        for key, state in children:
+            lines.extend(self._render_child(key, state))
+        return lines
+
+
+class Counter(_Metric):
+    """Monotonically increasing count, e.g. of cache lookups or upstream errors"""
+    kind = 'counter'
+
+    @property
+    def family(self):
+        return f"{self.name}_total"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._children[key] = self._children.get(key, 0) + amount
+
+    def _render_child(self, key, value):
+        return [f"{self.family}{_format_labels(self._labels(key))} {_format_value(value)}"]
+
+
+class Histogram(_Metric):
+    """Distribution of durations in cumulative buckets, with their sum and count"""
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._children.get(key)
+            if state is None:
+                state = self._children[key] = [[0] * len(self.buckets), 0.0]
+            counts = state[0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+                    break
+            state[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of a with block, also when it raises"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _render_child(self, key, state):
+        counts, total = state
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, counts):
+            cumulative += count
+            labels = self._labels(key, [('le', _format_value(float(bound)))])
+            lines.append(f"{self.name}_bucket{_format_labels(labels)} {cumulative}")
+        lines.append(f"{self.name}_sum{_format_labels(self._labels(key))} {_format_value(total)}")
+        lines.append(f"{self.name}_count{_format_labels(self._labels(key))} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """Process-wide set of metrics rendered in the Prometheus text format.
+
+    Counters and histograms are updated where the work happens. Values that are cheaper to read
+    than to track, such as store sizes, come from collectors called at scrape time; a collector
+    returns (name, type, help, [(labels dict, value), ...]) tuples.
+    """
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def add_collector(self, collect):
+        with self._lock:
+            self._collectors.append(collect)
+
+    def _register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """Return the exposition text of every metric and collector"""
+        with self._lock:
+            metrics = list(self._metrics)
+            collectors = list(self._collectors)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        for collect in collectors:
+            for name, kind, documentation, samples in collect():
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(sorted(labels.items()))} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+# Hot-path timings
+UPSTREAM_SECONDS = REGISTRY.histogram(
+    'weather_upstream_request_seconds', 'Open-Meteo request duration by endpoint (current or archive)', ['endpoint'])
+UPSTREAM_ERRORS = REGISTRY.counter(
+    'weather_upstream_errors', 'Failed Open-Meteo requests by endpoint', ['endpoint'])
+HISTORY_LOAD_SECONDS = REGISTRY.histogram(
+    'weather_history_load_seconds', 'Time to load the local history into the reading store')
+FEATURE_SECONDS = REGISTRY.histogram(
+    'weather_feature_seconds', 'Feature preparation time for training, by model (daily or hourly)', ['model'])
+TRAINING_SECONDS = REGISTRY.histogram(
+    'weather_training_seconds', 'Forest fitting time by model (daily or hourly)', ['model'], TRAINING_BUCKETS)
+PREDICTION_SECONDS = REGISTRY.histogram(
+    'weather_prediction_seconds', 'Forecast computation time by kind (daily, hourly or batch)', ['kind'])
+UPSTREAM_RETRIES = REGISTRY.counter(
+    'weather_upstream_retries', 'Open-Meteo requests retried after a timeout, connection error, 429 or 5xx', ['endpoint'])
+UPSTREAM_REJECTED = REGISTRY.counter(
+    'weather_upstream_rejected', 'Open-Meteo requests not sent, by reason (circuit_open or rate_limited)',
+    ['endpoint', 'reason'])
+RESPONSE_CACHE_LOOKUPS = REGISTRY.counter(
+    'weather_response_cache_lookups', 'Response cache lookups by result (hit or miss)', ['result'])
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    'weather_http_request_seconds', 'API request handling time by endpoint and status', ['endpoint', 'status'])
@@ -0,0 +1,128 @@
+import logging
+import os
+from ai_model.data_store import READING_FIELDS
+from ai_model.features import HOURLY_FEATURES
+
+# Bumped whenever the artifact layout changes; older artifacts are ignored and the model is retrained
+ARTIFACT_FORMAT = 5
+MODEL_ARTIFACT_NAME = "model.joblib"
+# The scikit-learn forests live in a sidecar next to the artifact: unpickling them copies every node
+# array into private memory, so only the processes that need them (incremental updates, the sklearn
+# backend) load it
+FORESTS_SUFFIX = ".forests"
+# Models map a [temperature, humidity, pressure] row to the same three targets; the hourly model maps
+# lag/rolling/calendar features to the next-hour change of those targets
+FEATURE_SCHEMA = list(READING_FIELDS)
+TARGET_SCHEMA = list(READING_FIELDS)
+HOURLY_FEATURE_SCHEMA = list(HOURLY_FEATURES)
+
+
+logger = logging.getLogger(__name__)
+
+
+def forests_path(path):
+    """Return the path of the sidecar holding an artifact's scikit-learn forests"""
+    return path + FORESTS_SUFFIX
+
+
+def _dump_atomically(value, path):
+    import joblib  # Deferred with the rest of the model stack to keep startup fast
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    joblib.dump(value, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def save_model_artifact(model, path):
+    """Save a ModelVersion with its data fingerprint and feature schema; readers never see a partial file.
+
+    The dump is uncompressed so that its arrays, including the flattened trees used for serving,
+    can be memory-mapped on load. The forests sidecar is written first, so it is never older than
+    the artifact; a loader that finds a newer one ignores it.
+    """
+
+    artifact = {
+        'format': ARTIFACT_FORMAT,
+        'version': model.version,
+        'feature_schema': FEATURE_SCHEMA,
+        'target_schema': TARGET_SCHEMA,
+        'hourly_feature_schema': HOURLY_FEATURE_SCHEMA,
+        'training_size': model.training_size,
+        'training_stats': model.training_stats,
+        'trained_at': model.trained_at,
+        'trained_through': model.trained_through,
+        'full_fit_at': model.full_fit_at,
+        'has_hourly_model': model.has_hourly_model,
+        'flat_forests': model.flat_forests,
+        'hourly_flat_forests': model.hourly_flat_forests
+    }
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    _dump_atomically({'version': model.version, 'forests': model.forests, 'hourly_forests': model.hourly_forests},
+                     forests_path(path))
+    _dump_atomically(artifact, path)
+
+
+def load_forests(path, version):
+    """Return (forests, hourly_forests) from an artifact's sidecar; raises ValueError if it holds another version"""
+    import joblib
+
+    sidecar = joblib.load(forests_path(path))
+    if not isinstance(sidecar, dict) or sidecar.get('version') != version:
+        raise ValueError(f"forests in {forests_path(path)} do not belong to model {version}")
+    return sidecar['forests'], sidecar['hourly_forests']
+
+
+def _forests_loader(path, version):
+    """Return a loader of the sidecar forests for a model served from flat trees; they are only needed to update it"""
+    def load():
+        try:
+            return load_forests(path, version)
+        except (OSError, ValueError) as e:
+            logger.warning("scikit-learn forests of model %s unavailable (%s); it will be refitted, not updated",
+                           version, e)
+            return None, None
+    return load
+
+
+def load_model_artifact(path, mmap_mode='r'):
+    """Load a ModelVersion saved by save_model_artifact; raises ValueError if it does not fit this code.
+
+    With mmap_mode='r' the arrays stay backed by the file, so processes loading the same artifact
+    share them through the page cache. The scikit-learn forests are only read from the sidecar when
+    they are first used, unless the flat trees are not being served.
+    """
+    import joblib
+    from ai_model.model_registry import ModelVersion
+
+    artifact = joblib.load(path, mmap_mode=mmap_mode)
+    if not isinstance(artifact, dict) or artifact.get('format') != ARTIFACT_FORMAT:
+        raise ValueError(f"unsupported model artifact format in {path}")
+    if artifact['feature_schema'] != FEATURE_SCHEMA or artifact['target_schema'] != TARGET_SCHEMA:
+        raise ValueError(f"model artifact {path} was trained on features {artifact['feature_schema']}, "
+                         f"expected {FEATURE_SCHEMA}")
+    if artifact['hourly_feature_schema'] != HOURLY_FEATURE_SCHEMA:
+        raise ValueError(f"model artifact {path} has hourly features {artifact['hourly_feature_schema']}, "
+                         f"expected {HOURLY_FEATURE_SCHEMA}")
+    version = artifact['version']
+    flat_forests = artifact['flat_forests']
+    hourly_flat_forests = artifact['hourly_flat_forests']
+    forests = hourly_forests = forests_loader = None
+    if (os.getenv('INFERENCE_BACKEND', 'flat') == 'flat' and flat_forests is not None
+            and (hourly_flat_forests is not None or not artifact['has_hourly_model'])):
+        forests_loader = _forests_loader(path, version)
+    else:
+        forests, hourly_forests = load_forests(path, version)
+        flat_forests = hourly_flat_forests = None     # Compiled again if the flat backend is enabled
+    return ModelVersion(
+        version,
+        forests,
+        artifact['training_size'],
+        artifact['training_stats'],
+        trained_at=artifact['trained_at'],
+        flat_forests=flat_forests,
+        hourly_forests=hourly_forests,
+        hourly_flat_forests=hourly_flat_forests,
+        trained_through=artifact['trained_through'],
+        full_fit_at=artifact['full_fit_at'],
+        forests_loader=forests_loader
+    )
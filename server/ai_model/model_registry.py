@@ -0,0 +1,206 @@
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from ai_model.training import predict_forests
+from ai_model.flat_forest import compile_forests
+from ai_model.model_artifact import save_model_artifact, load_model_artifact
+
+logger = logging.getLogger(__name__)
+
+
+class ModelVersion:
+    """Immutable bundle of the trained forests for one version of the training data"""
+    def __init__(self, version, forests, training_size, training_stats=None, trained_at=None, flat_forests=None,
+                 hourly_forests=None, hourly_flat_forests=None, trained_through=None, full_fit_at=None,
+                 forests_loader=None):
+        self.version = version
+        self._forests = forests  # [temp, humidity, pressure] forests, or one multi-output forest
+        self._hourly_forests = hourly_forests   # Next-hour change model on lag/time features; None if too little data
+        # Loaded artifacts read the scikit-learn forests on first use: flat serving never needs them
+        self._forests_loader = forests_loader
+        self._forests_lock = threading.Lock()
+        self.has_hourly_model = hourly_forests is not None or hourly_flat_forests is not None
+        self.training_size = training_size
+        self.training_stats = training_stats or {}
+        self.trained_at = trained_at or datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        self.trained_through = trained_through  # Timestamp of the newest reading the forests have seen
+        self.full_fit_at = full_fit_at if full_fit_at is not None else time.time()  # When the last full refit ran
+        # INFERENCE_BACKEND=flat serves from flattened copies of the trees; 'sklearn' calls the forests directly
+        self.flat_forests = None
+        self.hourly_flat_forests = None
+        if os.getenv('INFERENCE_BACKEND', 'flat') == 'flat':
+            self.flat_forests = flat_forests if flat_forests is not None else compile_forests(forests)
+            if hourly_forests is not None:
+                self.hourly_flat_forests = (hourly_flat_forests if hourly_flat_forests is not None
+                                            else compile_forests(hourly_forests))
+
+    @property
+    def forests(self):
+        self._load_forests()
+        return self._forests
+
+    @property
+    def hourly_forests(self):
+        self._load_forests()
+        return self._hourly_forests
+
+    def _load_forests(self):
+        """Call the loader of a loaded artifact once; it returns (forests, hourly_forests), or Nones if unavailable"""
+        if self._forests_loader is None:
+            return
+        with self._forests_lock:
+            if self._forests_loader is not None:
+                self._forests, self._hourly_forests = self._forests_loader()
+                self._forests_loader = None
+
+    def predict(self, X):
+        """Predict the [temperature, humidity, pressure] columns for each row of X"""
+        if self.flat_forests is not None:
+            return predict_forests(self.flat_forests, X)
+        return predict_forests(self.forests, X)
+
+    def predict_hourly(self, X):
+        """Predict the change of [temperature, humidity, pressure] over the next hour for hourly feature rows"""
+        if self.hourly_flat_forests is not None:
+            return predict_forests(self.hourly_flat_forests, X)
+        return predict_forests(self.hourly_forests, X)
+
+
+class ModelRegistry:
+    """Keeps the models trained on the latest data fingerprint and retrains them in the background"""
+    def __init__(self, predictor):
+        self.predictor = predictor
+        self._current = None    # ModelVersion currently used for serving
+        self._worker = None     # Background training thread, if any
+        self._lock = threading.Lock()
+
+    @property
+    def current(self):
+        """Return the model version currently used for serving (may be None)"""
+        return self._current
+
+    def get_latest(self, wait=False):
+        """Return a model for serving, scheduling a retrain if the data has changed since the last fit.
+
+        A stale model keeps serving while the retrain runs, so only the very first call
+        (or a call with wait=True) blocks on training. Follower processes never train: they return the
+        model published by the owning process, or None until it publishes one.
+        """
+        if self.predictor.is_follower():
+            model = self._published_model(wait)
+            # Unless the owner exited meanwhile and this process took the location over
+            if model is not None or self.predictor.is_follower():
+                return model
+
+        fingerprint = self.predictor.data_fingerprint()
+        with self._lock:
+            current = self._current
+            if current is not None and current.version == fingerprint:
+                return current
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._train_latest, daemon=True)
+                self._worker.start()
+            worker = self._worker
+
+        if wait or current is None:
+            worker.join()
+        return self._current
+
+    def train_in_background(self):
+        """Start training on the latest data if no training run is in progress, without waiting for it"""
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._train_latest, daemon=True)
+                self._worker.start()
+
+    def _published_model(self, wait):
+        """Return the owner's model, loading it if none is installed; with wait, poll until the owner publishes one"""
+        deadline = time.time() + (self.predictor.shared_state_wait if wait else 0)
+        while True:
+            if self._current is None:
+                model = self.predictor.shared_state.load_model()
+                if model is not None:
+                    self.install(model)
+            if self._current is not None or time.time() >= deadline or not self.predictor.is_follower():
+                return self._current
+            time.sleep(0.5)
+
+    def install(self, model):
+        """Serve a model trained elsewhere (e.g. published by another worker process)"""
+        self._current = model
+
+    def restore(self):
+        """Load the model saved by the previous run in the background; it serves until a retrain replaces it.
+
+        Requests arriving while it loads wait for the load instead of starting a training run.
+        """
+        with self._lock:
+            if self._current is not None or (self._worker is not None and self._worker.is_alive()):
+                return
+            self._worker = threading.Thread(target=self._load_persisted, daemon=True)
+            self._worker.start()
+
+    def _load_persisted(self):
+        """Install the model saved in the predictor's model file, training one if there is no usable file"""
+        model = None
+        try:
+            model = load_model_artifact(self.predictor.model_file)  # Imports scikit-learn, hence off the startup path
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning("Ignoring model artifact %s: %s", self.predictor.model_file, e)
+        if model is None:
+            self._train_latest()
+        elif self._current is None:
+            self._current = model
+            logger.info("Restored model %s trained at %s", model.version, model.trained_at)
+            self.predictor.broadcast_forecast(model)
+
+    def _persist(self, model):
+        """Save a model artifact for the next start and for the worker processes following this one"""
+        try:
+            save_model_artifact(model, self.predictor.model_file)
+        except Exception as e:
+            logger.error("Error saving model: %s", e)
+
+    def _can_update(self, current):
+        """Return True if the serving model may be updated incrementally rather than refitted"""
+        engine = self.predictor.training_engine
+        return (engine.strategy == 'incremental' and current is not None
+                and time.time() - current.full_fit_at < engine.full_refit_interval)
+
+    def _train_latest(self):
+        """Train on the newest data until the published model matches it"""
+        while True:
+            data = self.predictor.training_snapshot(copy=True)   # Private (timestamps, values) copy
+            fingerprint = self.predictor.compute_fingerprint(data)
+            current = self._current
+            if current is not None and current.version == fingerprint:
+                return
+
+            result = None
+            if self._can_update(current):
+                # Derive the new trees' seed from the data, so the same data always gives the same model
+                result = self.predictor.update_models(current, data, int(fingerprint[:8], 16))
+            full_fit = result is None
+            if full_fit:
+                result = self.predictor.fit_models(data)
+            if result is None:
+                return
+
+            # Publish the new models with a single reference swap
+            forests, hourly_forests, stats = result
+            training_size = len(data[0])
+            self._current = ModelVersion(
+                fingerprint, forests, training_size, stats, hourly_forests=hourly_forests,
+                trained_through=str(data[0][-1]), full_fit_at=None if full_fit else current.full_fit_at
+            )
+            logger.info("Model %s trained on %d readings (%s, %s, %d trees, %ss, %.1f MB of trees, peak RSS %s MB)",
+                        fingerprint, training_size, stats['strategy'], stats['mode'], stats['trees'],
+                        stats['fit_seconds'], stats['model_bytes'] / 1e6, stats['peak_rss_mb'])
+            if 'hourly' in stats:
+                logger.info("Hourly model trained on %d hours (%ss)", stats['hourly']['rows'], stats['hourly']['fit_seconds'])
+            self._persist(self._current)
+            self.predictor.broadcast_forecast(self._current)
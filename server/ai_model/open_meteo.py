@@ -0,0 +1,252 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+from ai_model.metrics import UPSTREAM_SECONDS, UPSTREAM_ERRORS, UPSTREAM_RETRIES, UPSTREAM_REJECTED
+from ai_model.resilience import UpstreamUnavailable, backoff_delay, is_retryable_status, get_default_guard
+
+logger = logging.getLogger(__name__)
+
+HOURLY_VARIABLES = 'temperature_2m,relative_humidity_2m,pressure_msl'
+
+
+def hourly_arrays(hourly_data):
+    """Convert an 'hourly' response block to (timestamps, values) arrays, dropping rows with missing values.
+
+    Returns (timestamps, values, invalid_count).
+    """
+    timestamps = np.array(hourly_data['time'], dtype='datetime64[s]')
+    # None becomes NaN when converted to float
+    values = np.column_stack([
+        np.array(hourly_data['temperature_2m'], dtype=np.float64),
+        np.array(hourly_data['relative_humidity_2m'], dtype=np.float64),
+        np.array(hourly_data['pressure_msl'], dtype=np.float64)
+    ]).reshape(-1, 3)
+    valid = ~np.isnan(values).any(axis=1)
+    return timestamps[valid], values[valid], int((~valid).sum())
+
+
+def batch_params(batch, params):
+    """Add the comma-separated coordinates and timezones of a batch of locations to the query params"""
+    query = dict(params)
+    query['latitude'] = ','.join(str(location.latitude) for location in batch)
+    query['longitude'] = ','.join(str(location.longitude) for location in batch)
+    query['timezone'] = ','.join(location.timezone for location in batch)
+    return query
+
+
+def unpack_batch(data, batch):
+    """Return one result per location of a batch response"""
+    # A single location comes back as an object, several as a list
+    if isinstance(data, dict):
+        data = [data]
+    if len(data) != len(batch):
+        raise ValueError(f"expected {len(batch)} locations, got {len(data)}")
+    return data
+
+
+def current_params():
+    """Query params of a current conditions request"""
+    return {'current': HOURLY_VARIABLES}
+
+
+def archive_params(start_date, end_date):
+    """Query params of an hourly archive request"""
+    return {
+        'start_date': start_date,
+        'end_date': end_date,
+        'hourly': HOURLY_VARIABLES
+    }
+
+
+def log_batch_failure(url, batch, endpoint, error):
+    """Count and log a batch request that produced no data"""
+    if isinstance(error, UpstreamUnavailable):
+        UPSTREAM_REJECTED.inc(endpoint=endpoint, reason=error.reason)
+        logger.warning("Skipped %s for %d locations: %s", url, len(batch), error)
+    else:
+        UPSTREAM_ERRORS.inc(endpoint=endpoint)
+        logger.error("Error fetching %s for %d locations: %s", url, len(batch), error)
+
+
+class OpenMeteoClient:
+    """Open-Meteo client that batches many locations per request over pooled keep-alive connections.
+
+    Every request goes through the process-wide UpstreamGuard: it waits its turn in the shared rate
+    limit, times out after OPEN_METEO_TIMEOUT seconds, is retried with jittered backoff on quick
+    connection errors, 429 and 5xx responses (a timed-out call is not retried, which bounds the
+    worst case to about two timeouts), and fails fast while the endpoint's circuit is open.
+    Callers get None for the affected locations and keep serving their last good readings.
+    """
+    def __init__(self, base_url=None, archive_url=None, batch_size=None, pool_size=None, guard=None):
+        self.base_url = base_url or os.getenv('WEATHER_API_BASE_URL', 'https://api.open-meteo.com/v1')
+        self.archive_url = archive_url or os.getenv('WEATHER_ARCHIVE_API_URL', 'https://archive-api.open-meteo.com/v1/archive')
+        self.batch_size = batch_size or int(os.getenv('OPEN_METEO_BATCH_SIZE', 50))  # Coordinates per request
+        pool_size = pool_size or int(os.getenv('OPEN_METEO_POOL_SIZE', 10))
+
+        # One session for all predictors so TCP/TLS connections are reused across calls
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.guard = guard or get_default_guard()
+
+    def fetch_current(self, locations):
+        """Fetch current conditions for each location; returns one 'current' dict (or None) per location"""
+        results = self._get_batched(f"{self.base_url}/forecast", locations, current_params(), 'current')
+        return [result.get('current') if result else None for result in results]
+
+    def fetch_hourly_archive(self, locations, start_date, end_date):
+        """Fetch archived hourly data for each location; returns one 'hourly' dict (or None) per location"""
+        results = self._get_batched(self.archive_url, locations, archive_params(start_date, end_date), 'archive')
+        return [result.get('hourly') if result else None for result in results]
+
+    def _get_json(self, url, params, endpoint):
+        """GET one request through the guard and return the decoded body; raises once retries are exhausted"""
+        guard = self.guard
+        breaker = guard.breaker(endpoint)
+        started = time.monotonic()
+        for attempt in range(guard.retries + 1):
+            # Queue for a rate limit token (raises UpstreamUnavailable while the circuit is open)
+            time.sleep(guard.admit(endpoint))
+            try:
+                with UPSTREAM_SECONDS.time(endpoint=endpoint):
+                    response = self.session.get(url, params=params, timeout=(guard.connect_timeout, guard.timeout))
+                response.raise_for_status()
+                data = response.json()
+            except requests.HTTPError as e:
+                if not is_retryable_status(e.response.status_code):
+                    breaker.record_success()    # The upstream is up; it rejected this request
+                    raise
+                error = e
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+            except Exception:
+                breaker.record_failure()
+                raise
+            else:
+                breaker.record_success()
+                return data
+
+            breaker.record_failure()
+            # Retries are for quick failures; one that already used up the timeout is not repeated
+            if attempt == guard.retries or time.monotonic() - started >= guard.timeout:
+                raise error
+            UPSTREAM_RETRIES.inc(endpoint=endpoint)
+            logger.debug("Retrying %s after: %s", url, error)
+            time.sleep(backoff_delay(attempt, guard.backoff_base, guard.backoff_cap))
+
+    def _get_batched(self, url, locations, params, endpoint):
+        """Issue one request per batch of coordinates and fan the responses back out in order"""
+        results = []
+        for start in range(0, len(locations), self.batch_size):
+            batch = locations[start:start + self.batch_size]
+            try:
+                results.extend(unpack_batch(self._get_json(url, batch_params(batch, params), endpoint), batch))
+            except Exception as e:
+                log_batch_failure(url, batch, endpoint, e)
+                results.extend([None] * len(batch))
+        return results
+
+
+class AsyncOpenMeteoClient:
+    """Asyncio counterpart of OpenMeteoClient built on a pooled httpx.AsyncClient, sharing its UpstreamGuard"""
+    def __init__(self, base_url=None, archive_url=None, batch_size=None, pool_size=None, guard=None):
+        import httpx  # Only needed by the async server
+
+        self.base_url = base_url or os.getenv('WEATHER_API_BASE_URL', 'https://api.open-meteo.com/v1')
+        self.archive_url = archive_url or os.getenv('WEATHER_ARCHIVE_API_URL', 'https://archive-api.open-meteo.com/v1/archive')
+        self.batch_size = batch_size or int(os.getenv('OPEN_METEO_BATCH_SIZE', 50))
+        pool_size = pool_size or int(os.getenv('OPEN_METEO_POOL_SIZE', 10))
+        self.guard = guard or get_default_guard()
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            timeout=httpx.Timeout(self.guard.timeout, connect=self.guard.connect_timeout)
+        )
+
+    async def fetch_current(self, locations):
+        """Fetch current conditions for each location; returns one 'current' dict (or None) per location"""
+        results = await self._get_batched(f"{self.base_url}/forecast", locations, current_params(), 'current')
+        return [result.get('current') if result else None for result in results]
+
+    async def fetch_hourly_archive(self, locations, start_date, end_date):
+        """Fetch archived hourly data for each location; returns one 'hourly' dict (or None) per location"""
+        results = await self._get_batched(self.archive_url, locations, archive_params(start_date, end_date), 'archive')
+        return [result.get('hourly') if result else None for result in results]
+
+    async def _get_json(self, url, params, endpoint):
+        """Asyncio variant of OpenMeteoClient._get_json; waits for tokens and backoff without blocking the loop"""
+        import httpx
+
+        guard = self.guard
+        breaker = guard.breaker(endpoint)
+        started = time.monotonic()
+        for attempt in range(guard.retries + 1):
+            await asyncio.sleep(guard.admit(endpoint))
+            start = time.perf_counter()
+            try:
+                response = await self.client.get(url, params=params)
+                response.raise_for_status()
+                data = response.json()
+            except httpx.HTTPStatusError as e:
+                if not is_retryable_status(e.response.status_code):
+                    breaker.record_success()    # The upstream is up; it rejected this request
+                    raise
+                error = e
+            except httpx.TransportError as e:    # Timeouts and connection errors
+                error = e
+            except Exception:
+                breaker.record_failure()
+                raise
+            else:
+                breaker.record_success()
+                return data
+            finally:
+                UPSTREAM_SECONDS.observe(time.perf_counter() - start, endpoint=endpoint)
+
+            breaker.record_failure()
+            # Retries are for quick failures; one that already used up the timeout is not repeated
+            if attempt == guard.retries or time.monotonic() - started >= guard.timeout:
+                raise error
+            UPSTREAM_RETRIES.inc(endpoint=endpoint)
+            logger.debug("Retrying %s after: %s", url, error)
+            await asyncio.sleep(backoff_delay(attempt, guard.backoff_base, guard.backoff_cap))
+
+    async def _get_batched(self, url, locations, params, endpoint):
+        """Issue the batch requests concurrently and fan the responses back out in order"""
+        batches = [locations[start:start + self.batch_size] for start in range(0, len(locations), self.batch_size)]
+        responses = await asyncio.gather(
+            *(self._get_json(url, batch_params(batch, params), endpoint) for batch in batches),
+            return_exceptions=True
+        )
+        results = []
+        for batch, data in zip(batches, responses):
+            try:
+                if isinstance(data, Exception):
+                    raise data
+                results.extend(unpack_batch(data, batch))
+            except Exception as e:
+                log_batch_failure(url, batch, endpoint, e)
+                results.extend([None] * len(batch))
+        return results
+
+    async def close(self):
+        """Close the pooled connections"""
+        await self.client.aclose()
+
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+
+def get_default_client():
+    """Return the process-wide client shared by all predictors"""
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = OpenMeteoClient()
+        return _default_client
@@ -0,0 +1,207 @@
+import json
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+from ai_model.weather_predictor import WeatherPredictor, history_capacity
+from ai_model.open_meteo import get_default_client
+
+logger = logging.getLogger(__name__)
+
+
+def missing_range_groups(predictors):
+    """Group predictors by the archive date ranges they are missing, so each range is fetched in one batch"""
+    groups = {}
+    for predictor in predictors:
+        for date_range in predictor.missing_date_ranges():
+            groups.setdefault(date_range, []).append(predictor)
+    return groups
+
+
+def site_id_for(name):
+    """Turn a city name into a site id usable in URLs and directory names"""
+    return re.sub(r'[^a-z0-9]+', '-', name.lower()).strip('-')
+
+
+def load_sites():
+    """Load the configured sites: the default one from the environment plus any from SITES_FILE"""
+    default_city = os.getenv('CITY', 'Kolkata')
+    sites = {
+        site_id_for(default_city): {
+            'city': default_city,
+            'latitude': float(os.getenv('LATITUDE', 22.5726)),
+            'longitude': float(os.getenv('LONGITUDE', 88.3639)),
+            'timezone': os.getenv('TIMEZONE', 'Asia/Kolkata')
+        }
+    }
+
+    # Optional JSON file mapping site ids to {"city", "latitude", "longitude", "timezone"}
+    sites_file = os.getenv('SITES_FILE', 'sites.json')
+    if os.path.exists(sites_file):
+        with open(sites_file, 'r') as f:
+            for site_id, site in json.load(f).items():
+                sites[site_id] = {
+                    'city': site.get('city', site_id),
+                    'latitude': float(site['latitude']),
+                    'longitude': float(site['longitude']),
+                    'timezone': site.get('timezone', 'auto')
+                }
+    return sites
+
+
+class PredictorPool:
+    """Bounded LRU pool of per-location predictors, warmed up lazily on first use"""
+    def __init__(self, max_size=None, sites=None):
+        self.max_size = max_size or int(os.getenv('MAX_LOCATIONS', 100))
+        history_capacity()  # Fail at startup, not on the first request, if HISTORY_CAPACITY is too small
+        self.sites = sites if sites is not None else load_sites()
+        self.default_site = site_id_for(os.getenv('CITY', 'Kolkata'))
+        self._predictors = OrderedDict()    # Location key -> WeatherPredictor, least recently used first
+        self._lock = threading.Lock()
+        self.client = get_default_client()
+
+    def resolve(self, site=None, latitude=None, longitude=None):
+        """Turn a site id or a lat/lon pair into (key, location settings); raises ValueError if invalid"""
+        if site:
+            if site not in self.sites:
+                raise ValueError(f"Unknown site '{site}'")
+            return site, self.sites[site]
+
+        if latitude is None and longitude is None:
+            return self.default_site, self.sites[self.default_site]
+        if latitude is None or longitude is None:
+            raise ValueError("Both 'lat' and 'lon' are required")
+
+        latitude = float(latitude)
+        longitude = float(longitude)
+        if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+            raise ValueError("Coordinates out of range")
+
+        # Round to ~1 km so that nearby requests share one predictor
+        key = f"{latitude:.2f},{longitude:.2f}"
+        return key, {
+            'city': key,
+            'latitude': round(latitude, 2),
+            'longitude': round(longitude, 2),
+            'timezone': 'auto'
+        }
+
+    def get(self, site=None, latitude=None, longitude=None, warm_up=True):
+        """Return the predictor for a location, creating it (and evicting the LRU one) if needed"""
+        key, location = self.resolve(site, latitude, longitude)
+        with self._lock:
+            predictor = self._predictors.get(key)
+            if predictor is None:
+                predictor = WeatherPredictor(
+                    city=location['city'],
+                    latitude=location['latitude'],
+                    longitude=location['longitude'],
+                    timezone=location['timezone'],
+                    data_dir=os.path.join('data', re.sub(r'[^A-Za-z0-9._-]', '_', key)),
+                    location_key=key,
+                    client=self.client
+                )
+                self._predictors[key] = predictor
+                while len(self._predictors) > self.max_size:
+                    evicted_key, evicted = self._predictors.popitem(last=False)
+                    evicted.close()     # Lets a recreated predictor (or another worker) own the location again
+                    logger.info("Evicted predictor for %s", evicted_key)
+            else:
+                self._predictors.move_to_end(key)
+
+        # Warm up (and pick up state published by other workers) outside the pool lock
+        # so other locations are not blocked
+        if warm_up:
+            predictor.warm_up()
+            if predictor.ready:
+                predictor.sync_shared_state()
+        return predictor
+
+    def warm_up_many(self, locations):
+        """Warm up several locations, downloading their archives in batched upstream calls.
+
+        locations is a list of dicts with optional 'site', 'latitude' and 'longitude' keys.
+        """
+        predictors = [self.get(warm_up=False, **location) for location in locations]
+        # Locations with a local history start from it and sync their archive in the background
+        warmed = [p for p in predictors if not p.ready and p.warm_up_local(fetch_current=False)]
+        cold = [predictor for predictor in predictors if not predictor.ready]
+        if cold:
+            archives = self._fetch_missing_archives(cold)
+            for predictor in cold:
+                if predictor.warm_up(archives[id(predictor)], fetch_current=False):
+                    warmed.append(predictor)
+        # Seed the first live readings in batched calls too
+        if warmed:
+            for predictor, current in zip(warmed, self.client.fetch_current(warmed)):
+                if current is not None:
+                    predictor.record_current(current)
+        for predictor in predictors:
+            if predictor.ready:
+                predictor.sync_shared_state()
+        return predictors
+
+    def _fetch_missing_archives(self, predictors):
+        """Fetch the archive ranges missing for each predictor; returns {id(predictor): [hourly blocks]}"""
+        archives = {id(predictor): [] for predictor in predictors}
+        for (start_str, end_str), group in missing_range_groups(predictors).items():
+            for predictor, hourly_data in zip(group, self.client.fetch_hourly_archive(group, start_str, end_str)):
+                if hourly_data is not None:
+                    archives[id(predictor)].append(hourly_data)
+        return archives
+
+    def sync_archives(self):
+        """Bring the local archive of every owned location up to date, fetching only missing ranges"""
+        predictors = self.owned_predictors()
+        archives = self._fetch_missing_archives(predictors)
+        for predictor in predictors:
+            for hourly_data in archives[id(predictor)]:
+                predictor.merge_historical_data(hourly_data)
+
+    def owned_predictors(self):
+        """Return the ready predictors this process ingests for, syncing the others from their owners"""
+        owned = []
+        for predictor in self.predictors():
+            if not predictor.ready:
+                continue
+            if predictor.is_follower():
+                predictor.sync_shared_state(min_interval=0)
+            else:
+                owned.append(predictor)
+        return owned
+
+    def refresh_current_weather(self):
+        """Fetch current conditions for every owned location in batched calls and record them"""
+        predictors = self.owned_predictors()
+        currents = self.client.fetch_current(predictors)
+        refreshed = 0
+        for predictor, current in zip(predictors, currents):
+            if current is not None and predictor.record_current(current):
+                refreshed += 1
+        return refreshed
+
+    def collect_metrics(self):
+        """Metrics collector reporting the pool and the per-location store sizes at scrape time"""
+        predictors = self.predictors()
+        per_location = [
+            ('weather_store_readings', 'Readings held in memory per location', lambda p: len(p.store)),
+            ('weather_history_rows', 'Hourly rows in the local archive per location', lambda p: len(p.history)),
+            ('weather_stream_subscribers', 'Open /api/stream connections per location', lambda p: p.updates.subscriber_count),
+        ]
+        families = [('weather_pooled_predictors', 'gauge', 'Locations held in the predictor pool', [({}, len(predictors))])]
+        for name, documentation, measure in per_location:
+            samples = [({'location': p.location_key}, measure(p)) for p in predictors]
+            families.append((name, 'gauge', documentation, samples))
+        ages = [({'location': p.location_key}, p.reading_age()) for p in predictors]
+        families.append(('weather_reading_age_seconds', 'gauge', 'Age of the latest live reading per location',
+                         [(labels, age) for labels, age in ages if age is not None]))
+        return families
+
+    def predictors(self):
+        """Return a snapshot of the pooled predictors"""
+        with self._lock:
+            return list(self._predictors.values())
+
+    def __len__(self):
+        return len(self._predictors)
@@ -0,0 +1,162 @@
+import os
+import random
+import threading
+import time
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+
+class UpstreamUnavailable(Exception):
+    """Raised instead of calling the upstream when its circuit is open or the rate limit queue is too long"""
+    def __init__(self, message, reason):
+        super().__init__(message)
+        self.reason = reason    # 'circuit_open' or 'rate_limited'
+
+
+class TokenBucket:
+    """Token bucket shared by every upstream call of the process, handing out tokens in arrival order.
+
+    A caller reserves the next token and is told how long to wait for it, so concurrent callers queue
+    behind each other at `rate` requests per second (after an initial `burst`) instead of each sleeping
+    a fixed interval. Async callers wait with asyncio.sleep, so the queue never blocks the event loop.
+    """
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, max_wait=None):
+        """Take a token; returns the seconds to wait before using it, or None if that exceeds max_wait"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            wait = max(0.0, (1 - self._tokens) / self.rate)
+            if max_wait is not None and wait > max_wait:
+                return None
+            # Tokens go negative while callers are queued; each one waits for its own refill
+            self._tokens -= 1
+            return wait
+
+
+class CircuitBreaker:
+    """Stops calling a failing upstream for `reset_timeout` seconds after `failure_threshold` consecutive failures.
+
+    After the timeout one trial call is let through (half-open): success closes the circuit, failure
+    opens it again. A trial that never reports back is replaced by another after `reset_timeout`.
+    Callers fail fast meanwhile and serve the last good data instead.
+    """
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_started = None  # monotonic time of the running half-open trial call
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Return True if a call may go to the upstream now"""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            now = time.monotonic()
+            if self.state == OPEN and now - self._opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+                self._trial_started = None
+            if self.state == HALF_OPEN and (self._trial_started is None or now - self._trial_started >= self.reset_timeout):
+                self._trial_started = now
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = CLOSED
+            self._failures = 0
+            self._trial_started = None
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == HALF_OPEN or self._failures >= self.failure_threshold:
+                self.state = OPEN
+                self._opened_at = time.monotonic()
+                self._trial_started = None
+
+
+def backoff_delay(attempt, base, cap):
+    """Full-jitter exponential backoff: a random delay up to base * 2^attempt, capped"""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def is_retryable_status(status_code):
+    """Throttling and server errors are worth retrying; other client errors are not"""
+    return status_code == 429 or status_code >= 500
+
+
+class UpstreamGuard:
+    """Rate limiting, retry policy and one circuit breaker per upstream endpoint, shared by the sync and async clients"""
+    def __init__(self, rate=None, burst=None, timeout=None, retries=None, failure_threshold=None, reset_timeout=None):
+        self.limiter = TokenBucket(
+            rate or float(os.getenv('OPEN_METEO_RATE', 5)),     # Requests per second
+            burst or int(os.getenv('OPEN_METEO_BURST', 10))
+        )
+        self.timeout = timeout or float(os.getenv('OPEN_METEO_TIMEOUT', 10))   # Seconds per request
+        self.connect_timeout = min(3.05, self.timeout)
+        self.retries = retries if retries is not None else int(os.getenv('OPEN_METEO_RETRIES', 2))
+        self.backoff_base = 0.25    # Seconds before the first retry, at most
+        self.backoff_cap = 4.0
+        # A request queued longer than its own timeout is not worth making
+        self.max_queue_wait = self.timeout
+        self.failure_threshold = failure_threshold or int(os.getenv('OPEN_METEO_BREAKER_THRESHOLD', 5))
+        self.reset_timeout = reset_timeout or float(os.getenv('OPEN_METEO_BREAKER_RESET', 30))
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def breaker(self, endpoint):
+        """Return the circuit breaker of an endpoint ('current' or 'archive')"""
+        with self._lock:
+            breaker = self._breakers.get(endpoint)
+            if breaker is None:
+                breaker = self._breakers[endpoint] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+            return breaker
+
+    def admit(self, endpoint):
+        """Check the circuit and take a rate limit token; returns the seconds to wait before calling.
+
+        Raises UpstreamUnavailable if the circuit is open or the queue is longer than max_queue_wait.
+        """
+        if not self.breaker(endpoint).allow():
+            raise UpstreamUnavailable(f"Circuit open for the {endpoint} endpoint", 'circuit_open')
+        wait = self.limiter.reserve(self.max_queue_wait)
+        if wait is None:
+            raise UpstreamUnavailable(f"Rate limit queue full for the {endpoint} endpoint", 'rate_limited')
+        return wait
+
+    @property
+    def degraded(self):
+        """True while any endpoint's circuit is not closed"""
+        with self._lock:
+            return any(breaker.state != CLOSED for breaker in self._breakers.values())
+
+    def collect_metrics(self):
+        """Metrics collector reporting which circuits are open"""
+        with self._lock:
+            breakers = list(self._breakers.items())
+        return [('weather_upstream_circuit_open', 'gauge', 'Whether the circuit of an upstream endpoint is open (1) or half-open (0.5)',
+                 [({'endpoint': endpoint}, {CLOSED: 0, HALF_OPEN: 0.5, OPEN: 1}[breaker.state]) for endpoint, breaker in breakers])]
+
+
+_default_guard = None
+_default_guard_lock = threading.Lock()
+
+
+def get_default_guard():
+    """Return the process-wide guard, so all clients share one rate limit and circuit state"""
+    global _default_guard
+    with _default_guard_lock:
+        if _default_guard is None:
+            _default_guard = UpstreamGuard()
+        return _default_guard
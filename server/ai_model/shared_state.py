@@ -0,0 +1,89 @@
+import os
+import numpy as np
+from ai_model.model_artifact import MODEL_ARTIFACT_NAME, load_model_artifact
+
+
+class SharedState:
+    """Shares one location's readings and trained models between worker processes through its data directory.
+
+    The first process to take the location's owner lock ingests readings and trains models, publishing
+    both as files; the other processes load those files instead of downloading and training their own copy.
+    Models are shared through the location's model artifact, memory-mapped so the followers share its pages.
+    If the owner exits, its lock is released and the next process to check takes over.
+    """
+    def __init__(self, data_dir):
+        self.data_dir = data_dir
+        self.data_file = os.path.join(data_dir, "shared_readings.npz")
+        self.model_file = os.path.join(data_dir, MODEL_ARTIFACT_NAME)  # Written by the owner's ModelRegistry
+        self.is_owner = False
+        self._lock_fd = None
+        self._data_mtime = 0    # mtime of the last loaded files, to skip unchanged ones
+        self._model_mtime = 0
+
+    def try_acquire_ownership(self):
+        """Return True if this process owns the location, taking the lock if it is free"""
+        if self.is_owner:
+            return True
+        import fcntl  # POSIX only, so imported when shared state is actually used
+
+        os.makedirs(self.data_dir, exist_ok=True)
+        fd = os.open(os.path.join(self.data_dir, ".owner.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        # Keep the descriptor open for the lifetime of the process to hold the lock
+        self._lock_fd = fd
+        self.is_owner = True
+        return True
+
+    def release(self):
+        """Give up ownership so another predictor, in this process or another, can take the location over"""
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)     # Closing the descriptor releases the flock
+            self._lock_fd = None
+        self.is_owner = False
+
+    def _write_atomically(self, path, write):
+        """Write a file through a temporary name so readers never see a partial file"""
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            write(f)
+        os.replace(tmp_path, path)
+
+    def publish_data(self, timestamps, values, last_reading_time):
+        """Publish the owner's readings"""
+        self._write_atomically(self.data_file, lambda f: np.savez(
+            f,
+            timestamps=timestamps.astype('int64'),
+            values=values,
+            last_reading_time=np.float64(last_reading_time or 0)
+        ))
+
+    def load_data(self):
+        """Return (timestamps, values, last_reading_time) if the published readings changed, else None"""
+        mtime = self._mtime(self.data_file)
+        if mtime is None or mtime == self._data_mtime:
+            return None
+        with np.load(self.data_file) as data:
+            timestamps = data['timestamps'].astype('datetime64[s]')
+            values = data['values']
+            last_reading_time = float(data['last_reading_time']) or None
+        self._data_mtime = mtime
+        return timestamps, values, last_reading_time
+
+    def load_model(self):
+        """Return the published ModelVersion if it changed since the last load, else None"""
+        mtime = self._mtime(self.model_file)
+        if mtime is None or mtime == self._model_mtime:
+            return None
+        model = load_model_artifact(self.model_file)
+        self._model_mtime = mtime
+        return model
+
+    def _mtime(self, path):
+        try:
+            return os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return None
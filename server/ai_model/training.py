@@ -0,0 +1,126 @@
+import copy
+import math
+import os
+import time
+import numpy as np
+
+try:
+    import resource     # Peak RSS reporting; not available on Windows
+except ImportError:
+    resource = None
+
+TRAINING_MODES = ('separate', 'multi_output')
+TRAINING_STRATEGIES = ('full', 'incremental')
+
+
+def forest_nbytes(forest):
+    """Return the memory held by the node arrays of a fitted forest"""
+    total = 0
+    for estimator in forest.estimators_:
+        tree = estimator.tree_
+        total += tree.children_left.nbytes + tree.children_right.nbytes + tree.feature.nbytes
+        total += tree.threshold.nbytes + tree.value.nbytes + tree.impurity.nbytes
+        total += tree.n_node_samples.nbytes + tree.weighted_n_node_samples.nbytes
+    return total
+
+
+def peak_rss_mb():
+    """Return the peak resident set size of this process in MB, or None if unknown"""
+    if resource is None:
+        return None
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def replace_oldest_trees(forest, new_trees):
+    """Return a copy of a fitted forest with its oldest trees swapped for new_trees; the original is left untouched"""
+    updated = copy.copy(forest)
+    updated.estimators_ = list(forest.estimators_[len(new_trees):]) + list(new_trees)
+    return updated
+
+
+class TrainingEngine:
+    """Fits the forecast forests with configurable parallelism, either one per variable or one multi-output forest.
+
+    With TRAINING_STRATEGY=incremental, models are brought up to date with update() between full refits
+    every FULL_REFIT_INTERVAL seconds.
+    """
+    def __init__(self, mode=None, n_jobs=None, n_estimators=100, random_state=42, strategy=None, full_refit_interval=None):
+        self.mode = mode or os.getenv('TRAINING_MODE', 'separate')
+        if self.mode not in TRAINING_MODES:
+            raise ValueError(f"TRAINING_MODE must be one of {TRAINING_MODES}, got '{self.mode}'")
+        self.strategy = strategy or os.getenv('TRAINING_STRATEGY', 'full')
+        if self.strategy not in TRAINING_STRATEGIES:
+            raise ValueError(f"TRAINING_STRATEGY must be one of {TRAINING_STRATEGIES}, got '{self.strategy}'")
+        self.full_refit_interval = full_refit_interval or int(os.getenv('FULL_REFIT_INTERVAL', 86400))  # Seconds
+        # -1 builds trees on all cores
+        self.n_jobs = n_jobs if n_jobs is not None else int(os.getenv('TRAINING_N_JOBS', -1))
+        self.n_estimators = n_estimators
+        self.random_state = random_state
+
+    def new_forest(self, n_estimators=None, random_state=None):
+        """Create an unfitted forest with the engine's settings"""
+        from sklearn.ensemble import RandomForestRegressor  # Slow import, deferred until the first fit
+
+        return RandomForestRegressor(
+            n_estimators=n_estimators or self.n_estimators,
+            random_state=random_state if random_state is not None else self.random_state,
+            n_jobs=self.n_jobs
+        )
+
+    def fit(self, X, Y, mode=None):
+        """Fit the forests on features X and the (n, 3) targets Y; returns (forests, stats).
+
+        mode overrides the engine's TRAINING_MODE for this fit.
+        """
+        mode = mode or self.mode
+        start = time.perf_counter()
+        if mode == 'multi_output':
+            # One forest predicts all three targets, so the trees are built once
+            forests = [self.new_forest().fit(X, Y)]
+        else:
+            forests = [self.new_forest().fit(X, Y[:, column]) for column in range(Y.shape[1])]
+        # Serving predicts a handful of rows at a time, where spinning up joblib workers costs more than it saves
+        for forest in forests:
+            forest.set_params(n_jobs=1)
+
+        return forests, self._stats(forests, mode, 'full', start)
+
+    def update(self, forests, X, Y, new_rows, random_state):
+        """Fold new data into fitted forests; returns (forests, stats) like fit().
+
+        X and Y are the current training window, whose last new_rows rows arrived since the forests were
+        fitted. A share of the trees equal to the share of new rows (at least one per forest) is refitted
+        on the window and replaces the oldest trees, so an update costs about new_rows / len(X) of a full
+        fit, and a full window of new data retires every tree. random_state must differ between updates,
+        or the new trees repeat the ones they replace.
+        """
+        start = time.perf_counter()
+        count = min(self.n_estimators, max(1, math.ceil(self.n_estimators * new_rows / len(X))))
+        # One forest predicts all targets in multi-output mode; otherwise there is one forest per column
+        targets = [Y] if len(forests) == 1 else [Y[:, column] for column in range(Y.shape[1])]
+        updated = []
+        for forest, y in zip(forests, targets):
+            new_trees = self.new_forest(count, random_state).fit(X, y).estimators_
+            updated.append(replace_oldest_trees(forest, new_trees))
+
+        stats = self._stats(updated, 'multi_output' if len(forests) == 1 else 'separate', 'incremental', start)
+        stats['trees_replaced'] = count * len(forests)
+        return updated, stats
+
+    def _stats(self, forests, mode, strategy, start):
+        return {
+            'mode': mode,
+            'strategy': strategy,
+            'n_jobs': self.n_jobs,
+            'trees': sum(len(forest.estimators_) for forest in forests),
+            'fit_seconds': round(time.perf_counter() - start, 3),
+            'model_bytes': sum(forest_nbytes(forest) for forest in forests),
+            'peak_rss_mb': peak_rss_mb()
+        }
+
+
+def predict_forests(forests, X):
+    """Predict the (n, 3) targets for X with forests fitted by TrainingEngine.fit"""
+    if len(forests) == 1:
+        return forests[0].predict(X).reshape(len(X), -1)
+    return np.column_stack([forest.predict(X) for forest in forests])
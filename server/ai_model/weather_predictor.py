@@ -1,30 +1,80 @@
-import requests
-import pandas as pd
 import numpy as np
-from sklearn.ensemble import RandomForestRegressor
 from datetime import datetime, timedelta
 import time
-import json
 import os
-import csv
-import math
+import hashlib
+import logging
+import threading
 from dotenv import load_dotenv
+from ai_model.model_registry import ModelRegistry
+from ai_model.training import TrainingEngine
+from ai_model.forecasting import predict_forecasts, forecast_hourly, forecast_seed, HOURLY_FORECAST_HOURS
+from ai_model.forecast_history import ForecastHistory
+from ai_model.features import HourlyFeatureState, training_matrix
+from ai_model.data_store import WeatherDataStore
+from ai_model.open_meteo import get_default_client, hourly_arrays
+from ai_model.history_file import HistoryFile
+from ai_model.ingestion import IngestionScheduler
+from ai_model.shared_state import SharedState
+from ai_model.model_artifact import MODEL_ARTIFACT_NAME
+from ai_model.broadcaster import Broadcaster, format_event
+from ai_model.metrics import HISTORY_LOAD_SECONDS, FEATURE_SECONDS, TRAINING_SECONDS, PREDICTION_SECONDS
 
 # Load environment variables
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+TRAINING_WINDOW = 720   # Latest readings used for training (30 days)
+
+
+def history_capacity():
+    """Return the readings kept in each store (HISTORY_CAPACITY); raises ValueError if it is too small.
+
+    The store must hold twice the training window so that training views are not overwritten by the
+    next reading.
+    """
+    capacity = int(os.getenv('HISTORY_CAPACITY', 8760))     # 1 year hourly
+    if capacity < 2 * TRAINING_WINDOW:
+        raise ValueError(f"HISTORY_CAPACITY must be at least {2 * TRAINING_WINDOW} readings, "
+                         f"twice the training window")
+    return capacity
+
 class WeatherPredictor:
-    def __init__(self):
-        self.city = os.getenv('CITY', 'Kolkata')
-        self.latitude = float(os.getenv('LATITUDE', 22.5726))
-        self.longitude = float(os.getenv('LONGITUDE', 88.3639))
-        self.base_url = os.getenv('WEATHER_API_BASE_URL', 'https://api.open-meteo.com/v1')
-        self.archive_url = os.getenv('WEATHER_ARCHIVE_API_URL', 'https://archive-api.open-meteo.com/v1/archive')
-        self.timezone = os.getenv('TIMEZONE', 'Asia/Kolkata')
-        self.historical_data = []  # Local list to store readings
-        self.max_readings = 720     # Maximum number of readings to store for current conditions
-        self.last_api_call = 0
-        self.min_api_interval = 1  # Minimum 1 second between API calls
+    def __init__(self, city=None, latitude=None, longitude=None, timezone=None, data_dir="data", location_key=None, client=None):
+        # Location defaults to the one configured in the environment
+        self.city = city or os.getenv('CITY', 'Kolkata')
+        self.location_key = location_key or self.city
+        self.latitude = float(latitude if latitude is not None else os.getenv('LATITUDE', 22.5726))
+        self.longitude = float(longitude if longitude is not None else os.getenv('LONGITUDE', 88.3639))
+        self.client = client or get_default_client()  # Shared, connection-pooled Open-Meteo client
+        self.timezone = timezone or os.getenv('TIMEZONE', 'Asia/Kolkata')
+        self.data_dir = data_dir
+        self.max_readings = history_capacity()  # Readings kept in the store
+        self.training_window = TRAINING_WINDOW
+        self.hourly_training_hours = 720    # Latest hours used to train the hourly model (30 days)
+        self.features = HourlyFeatureState()   # Hourly lags of the latest readings, updated as they arrive
+        self.store = WeatherDataStore(self.max_readings)
+        self.history = HistoryFile(self.data_dir)   # Hourly archive persisted on disk
+        # Latest model artifact: restored on restart and loaded by follower worker processes
+        self.model_file = os.path.join(self.data_dir, MODEL_ARTIFACT_NAME)
+        # Serve from the persisted history and model at startup and catch up with the upstream in the background
+        self.fast_startup = os.getenv('FAST_STARTUP', 'True').lower() == 'true'
+        self.last_reading_time = None  # time.time() when the latest live reading was recorded
+        self._fingerprint = (None, None)  # (store version, fingerprint) of the training data
+        self.training_engine = TrainingEngine()  # TRAINING_MODE / TRAINING_N_JOBS select how forests are fitted
+        self.model_registry = ModelRegistry(self)
+        self.ready = False          # Set once warm_up() has loaded the initial data
+        self._warm_up_lock = threading.Lock()
+        # With SHARED_STATE enabled, worker processes share one copy of the readings and models per location
+        self.shared_state = SharedState(self.data_dir) if os.getenv('SHARED_STATE', 'False').lower() == 'true' else None
+        self.shared_state_wait = int(os.getenv('SHARED_STATE_WAIT', 60))  # Seconds to wait for the owner's data
+        self._last_sync = 0
+        self.updates = Broadcaster()    # Pushes new readings and forecasts to stream subscribers
+        # Forecast computed after the latest ingestion or training, served as is until either changes
+        self._materialized = (None, None)   # (key, payload)
+        self._materialize_lock = threading.Lock()
+        self.forecast_history = ForecastHistory(self.data_dir)     # Past materialized forecasts (FORECAST_HISTORY)
 
     def calculate_sky_condition(self, temp, humidity, pressure):
         """Determine sky condition based on humidity and pressure"""
@@ -70,391 +120,533 @@ class WeatherPredictor:
         return ", ".join(conditions)
 
     def fetch_sensor_data(self):
-        """Fetch current weather data from Open-Meteo API"""
+        """Fetch current weather data from Open-Meteo API.
+
+        The shared client rate-limits, times out and retries the call; on failure the last good reading
+        keeps being served (reported as stale once it is two ingestion intervals old).
+        """
         try:
-            # Check if enough time has passed since last API call
-            current_time = time.time()
-            if current_time - self.last_api_call < self.min_api_interval:
-                time.sleep(self.min_api_interval - (current_time - self.last_api_call))
-            
-            # Make API request
-            url = f"{self.base_url}/forecast"
-            params = {
-                'latitude': self.latitude,
-                'longitude': self.longitude,
-                'current': 'temperature_2m,relative_humidity_2m,pressure_msl',
-                'timezone': self.timezone
-            }
-            
-            response = requests.get(url, params=params)
-            response.raise_for_status()
-            data = response.json()
+            current = self.client.fetch_current([self])[0]
+            if current is None:
+                return False
+            return self.record_current(current)
             
+        except Exception as e:
+            logger.error("Error fetching sensor data: %s", e)
+            return False
+
+    def record_current(self, current):
+        """Append the 'current' block of an Open-Meteo forecast response to the store"""
+        try:
             # Extract current conditions
-            current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            new_reading = {
-                'created_at': current_time,
-                'field1': str(data['current']['temperature_2m']),
-                'field2': str(data['current']['relative_humidity_2m']),
-                'field3': str(data['current']['pressure_msl'])
-            }
-            
-            # Print current conditions
-            print("\nCurrent Weather Conditions in Kolkata:")
-            print(f"Time: {current_time}")
-            print(f"Temperature: {new_reading['field1']}°C")
-            print(f"Humidity: {new_reading['field2']}%")
-            print(f"Pressure: {new_reading['field3']} hPa")
-            
-            # Update historical data
-            if len(self.historical_data) >= self.max_readings:
-                # Remove oldest reading and append new one
-                self.historical_data.pop(0)
-                self.historical_data.append(new_reading)
-                print(f"Replaced oldest reading. Current size: {len(self.historical_data)} readings")
-            else:
-                # Simply append new reading
-                self.historical_data.append(new_reading)
-                print(f"Added new reading. Current size: {len(self.historical_data)} readings")
-            
-            # Update last API call time
-            self.last_api_call = time.time()
+            current_time = self.observation_time(current)
+            temperature = float(current['temperature_2m'])
+            humidity = float(current['relative_humidity_2m'])
+            pressure = float(current['pressure_msl'])
+            
+            # Log current conditions (every reading of every location, so only at DEBUG level)
+            logger.debug("Current weather in %s at %s: %s°C, %s%%, %s hPa",
+                         self.city, current_time, temperature, humidity, pressure)
+            
+            # Polls within one upstream update interval return the same observation: it only renews the age
+            latest = self.store.latest()
+            if latest is not None and latest['created_at'] == current_time:
+                self.last_reading_time = time.time()
+                self.publish_data()
+                logger.debug("Observation %s for %s already recorded", current_time, self.city)
+                return True
+
+            # Update historical data (the store evicts the oldest reading once full)
+            replaced = self.store.is_full()
+            self.store.append(current_time, temperature, humidity, pressure)
+            self.features.update(current_time, (temperature, humidity, pressure))
+            self.last_reading_time = time.time()
+            self.publish_data()
+            self.broadcast_reading()
+            logger.debug("%s reading for %s. Current size: %d readings",
+                         "Replaced oldest" if replaced else "Added new", self.city, len(self.store))
             return True
             
         except Exception as e:
-            print(f"Error fetching sensor data: {str(e)}")
+            logger.error("Error recording sensor data: %s", e)
             return False
 
+    @staticmethod
+    def observation_time(current):
+        """Return the time of a 'current' block as a store timestamp.
+
+        Open-Meteo reports it in the location's timezone, like the archive rows, so hourly lags line up at
+        the archive/live boundary; the server clock is only used if the block has no time.
+        """
+        observed = current.get('time')
+        moment = datetime.fromisoformat(observed) if observed else datetime.now()
+        return moment.strftime('%Y-%m-%d %H:%M:%S')
+
+    def reading_age(self):
+        """Return the age in seconds of the latest live reading, or None if there is none yet"""
+        if self.last_reading_time is None:
+            return None
+        return time.time() - self.last_reading_time
+
+    def reading_payload(self):
+        """Return the latest reading as sent to stream subscribers, or None if there is none yet"""
+        latest = self.store.latest()
+        if latest is None:
+            return None
+        return {
+            'temperature': latest['temperature'],
+            'humidity': latest['humidity'],
+            'pressure': latest['pressure'],
+            'sky_condition': self.calculate_sky_condition(latest['temperature'], latest['humidity'], latest['pressure']),
+            'timestamp': latest['created_at'],
+            'location': self.city
+        }
+
+    def initial_stream_event(self):
+        """Return the SSE message that opens a stream: the latest reading, if any"""
+        payload = self.reading_payload()
+        return format_event('reading', payload) if payload is not None else None
+
+    def broadcast_reading(self):
+        """Push the latest reading to stream subscribers, then materialize and push the forecast it leads to"""
+        if self.updates.subscriber_count > 0:
+            payload = self.reading_payload()
+            if payload is not None:
+                self.updates.publish('reading', payload)
+        self.broadcast_forecast()
+
+    def broadcast_forecast(self, model=None):
+        """Materialize the forecast of the serving model and push it to stream subscribers"""
+        if len(self.store) < 240:
+            return
+        if model is None:
+            if self.model_registry.current is None:
+                # Never block the ingestion path on a first training run; the owner starts it in the background
+                if not self.is_follower():
+                    self.model_registry.train_in_background()
+                return
+            # Serves the current model and schedules a retrain if the readings moved past it
+            model = self.model_registry.get_latest()
+        payload = self.materialize_forecast(model)
+        if payload is not None and self.updates.subscriber_count > 0:
+            self.updates.publish('forecast', payload)
+
+    def materialize_forecast(self, model):
+        """Return the 7-day forecast payload of the current readings and model, computing it only if they changed.
+
+        Called right after each ingestion and training run, so requests find it ready. The forecast is
+        deterministic for given readings and model; it is recomputed on demand when the date or the
+        day/night half changes, and each one computed is recorded in the forecast history.
+        """
+        now = datetime.now()
+        data_version = self.data_fingerprint()
+        key = (data_version, model.version, now.date(), 6 <= now.hour < 18)
+        with self._materialize_lock:
+            cached_key, payload = self._materialized
+            if cached_key == key:
+                return payload
+
+            forecast = self.predict_weather(model, now=now)
+            if not forecast:
+                return None
+            payload = {
+                'forecast': forecast,
+                'model_version': model.version,
+                'data_version': data_version,
+                'generated_at': now.strftime('%Y-%m-%d %H:%M:%S')
+            }
+            self._materialized = (key, payload)
+            # Followers compute the same forecasts as the owner, which keeps the history file
+            if self.shared_state is None or self.shared_state.is_owner:
+                latest = self.store.latest()
+                self.forecast_history.append(dict(payload, based_on=latest['created_at'] if latest else None))
+        return payload
+
     def prepare_features(self, data):
-        """Prepare features for the model"""
-        features = []
-        for entry in data:
-            features.append([
-                float(entry['field1']),  # Temperature
-                float(entry['field2']),  # Humidity
-                float(entry['field3'])   # Pressure
-            ])
-        return np.array(features)
+        """Prepare features for the model: the [temperature, humidity, pressure] columns"""
+        _, values = data
+        return values
+
+    def training_snapshot(self, copy=False):
+        """Return (timestamps, values) of the readings used for training, as views or private copies"""
+        _, timestamps, values = self.store.snapshot(self.training_window, copy=copy)
+        return timestamps, values
+
+    def compute_fingerprint(self, data):
+        """Compute a short content hash identifying a set of readings"""
+        timestamps, values = data
+        digest = hashlib.sha1(timestamps.tobytes())
+        digest.update(values.tobytes())
+        return digest.hexdigest()[:12]
+
+    def data_fingerprint(self):
+        """Return the fingerprint of the current training data, cached until the store changes"""
+        cached_version, fingerprint = self._fingerprint
+        if self.store.version == cached_version:
+            return fingerprint
+        # A private copy: a store replaced meanwhile could overwrite a view while it is hashed
+        version, timestamps, values = self.store.snapshot(self.training_window, copy=True)
+        if version != cached_version:
+            fingerprint = self.compute_fingerprint((timestamps, values))
+            self._fingerprint = (version, fingerprint)
+        return fingerprint
+
+    def fit_models(self, data):
+        """Fit the temperature, humidity and pressure models on the given readings; returns (forests, stats)"""
+        with FEATURE_SECONDS.time(model='daily'):
+            X = self.prepare_features(data)
+        if len(X) < 240:  # Need at least 240 readings (10 days)
+            logger.error("Insufficient data for training. Need at least 240 readings, got %d", len(X))
+            return None
+
+        # All three target variables are the [temperature, humidity, pressure] columns
+        with TRAINING_SECONDS.time(model='daily'):
+            forests, stats = self.training_engine.fit(X, X)
+
+        # The hourly model learns the next-hour change from lag, rolling and calendar features
+        hourly_forests = None
+        with FEATURE_SECONDS.time(model='hourly'):
+            _, timestamps, values = self.store.snapshot(copy=True)
+            X_hourly, Y_hourly = training_matrix(timestamps, values, self.hourly_training_hours)
+        if len(X_hourly) >= 240:
+            # Forecasts predict 168 sequential steps, so one multi-output forest keeps each step to one call
+            with TRAINING_SECONDS.time(model='hourly'):
+                hourly_forests, hourly_stats = self.training_engine.fit(X_hourly, Y_hourly, mode='multi_output')
+            stats['hourly'] = {'rows': len(X_hourly), 'fit_seconds': hourly_stats['fit_seconds'],
+                               'model_bytes': hourly_stats['model_bytes']}
+        return forests, hourly_forests, stats
+
+    def update_models(self, model, data, random_state):
+        """Fold the readings added since `model` was trained into its forests (TRAINING_STRATEGY=incremental).
+
+        Returns (forests, hourly_forests, stats) like fit_models, or None when only a full refit fits the
+        data: no trace of the model's last reading, nothing new, a whole window of new readings, or no
+        scikit-learn forests to update.
+        """
+        timestamps, values = data
+        if model.trained_through is None or len(values) < 240:
+            return None
+        trained_through = np.datetime64(model.trained_through, 's')
+        new_rows = int(np.count_nonzero(timestamps > trained_through))
+        if new_rows == 0 or new_rows >= len(timestamps) or trained_through not in timestamps:
+            return None
+        if model.forests is None:   # Restored artifact whose scikit-learn forests could not be loaded
+            return None
+
+        with FEATURE_SECONDS.time(model='daily'):
+            X = self.prepare_features(data)
+        with TRAINING_SECONDS.time(model='daily'):
+            forests, stats = self.training_engine.update(model.forests, X, X, new_rows, random_state)
+
+        # The hourly model gains one training row per completed hour
+        hourly_forests = model.hourly_forests
+        new_hours = int((timestamps[-1].astype('datetime64[h]') - trained_through.astype('datetime64[h]')).astype(np.int64))
+        if hourly_forests is not None and new_hours > 0:
+            with FEATURE_SECONDS.time(model='hourly'):
+                _, all_timestamps, all_values = self.store.snapshot(copy=True)
+                X_hourly, Y_hourly = training_matrix(all_timestamps, all_values, self.hourly_training_hours)
+            if len(X_hourly) >= 240:
+                with TRAINING_SECONDS.time(model='hourly'):
+                    hourly_forests, hourly_stats = self.training_engine.update(
+                        hourly_forests, X_hourly, Y_hourly, new_hours, random_state)
+                stats['hourly'] = {'rows': len(X_hourly), 'fit_seconds': hourly_stats['fit_seconds'],
+                                   'model_bytes': hourly_stats['model_bytes']}
+        return forests, hourly_forests, stats
 
     def train_model(self):
-        """Train the model on historical data"""
-        if len(self.historical_data) < 240:  # Need at least 240 readings (10 days)
-            print(f"Error: Insufficient data for training. Need at least 240 readings, got {len(self.historical_data)}")
-            return False
-        if len(self.historical_data) > 720:  # Cap at 720 readings (30 days)
-            self.historical_data = self.historical_data[-720:]
-
-        X = self.prepare_features(self.historical_data)
-        # Prepare all three target variables
-        y_temp = np.array([float(entry['field1']) for entry in self.historical_data])
-        y_humidity = np.array([float(entry['field2']) for entry in self.historical_data])
-        y_pressure = np.array([float(entry['field3']) for entry in self.historical_data])
-        
-        # Train three separate Random Forest models
-        self.temp_model = RandomForestRegressor(n_estimators=100, random_state=42).fit(X, y_temp)
-        self.humidity_model = RandomForestRegressor(n_estimators=100, random_state=42).fit(X, y_humidity)
-        self.pressure_model = RandomForestRegressor(n_estimators=100, random_state=42).fit(X, y_pressure)
-        return True
+        """Make sure the models are trained on the current historical data"""
+        return self.model_registry.get_latest(wait=True) is not None
+
+    def forecast_inputs(self):
+        """Return the base reading and the per-variable standard deviation used to seed a forecast"""
+        _, values = self.training_snapshot(copy=True)
+        # Get the last reading as base for predictions and the variations from historical data
+        return values[-1], np.std(values, axis=0)
 
-    def predict_weather(self):
-        """Predict weather for the next 7 days using our trained model"""
-        if not self.train_model():
+    def forecast_seed(self, model):
+        """Seed of the day-to-day variation: the same readings and model always give the same forecast"""
+        return forecast_seed(model.version, self.data_fingerprint())
+
+    def predict_weather(self, model=None, seed=None, now=None):
+        """Predict weather for the next 7 days using our trained model; seed defaults to forecast_seed(model)"""
+        if model is None:
+            model = self.model_registry.get_latest()
+        if model is None:
             return None
 
-        predictions = []
-        current_date = datetime.now()
+        with PREDICTION_SECONDS.time(kind='daily'):
+            base_row, variation = self.forecast_inputs()
+            if seed is None:
+                seed = self.forecast_seed(model)
+            return predict_forecasts([model], [base_row], [variation], seed=seed, now=now)[0]
 
-        # Get the last reading as base for predictions
-        last_reading = self.historical_data[-1]
-        base_temp = float(last_reading['field1'])
-        base_humidity = float(last_reading['field2'])
-        base_pressure = float(last_reading['field3'])
+    def predict_hourly_weather(self, model=None, hours=HOURLY_FORECAST_HOURS):
+        """Predict hourly weather for the next `hours` hours, starting from the incrementally kept features"""
+        if model is None:
+            model = self.model_registry.get_latest()
+        state = self.features.snapshot()
+        if model is None or not model.has_hourly_model or state is None:
+            return None
 
-        # Calculate variations from historical data
-        temp_variation = np.std([float(r['field1']) for r in self.historical_data])
-        humidity_variation = np.std([float(r['field2']) for r in self.historical_data])
-        pressure_variation = np.std([float(r['field3']) for r in self.historical_data])
+        hour, window = state
+        with PREDICTION_SECONDS.time(kind='hourly'):
+            return forecast_hourly([model], [window], [hour], hours)[0]
 
-        for i in range(0, 7):
-            # Prepare features for prediction
-            features = np.array([[base_temp, base_humidity, base_pressure]])
-            
-            # Predict all three values using their respective models
-            base_predicted_temp = self.temp_model.predict(features)[0]
-            base_predicted_humidity = self.humidity_model.predict(features)[0]
-            base_predicted_pressure = self.pressure_model.predict(features)[0]
-            
-            # Add some random variation to the base predictions
-            daily_temp_variation = np.random.normal(0, temp_variation * 0.2)
-            daily_humidity_variation = np.random.normal(0, humidity_variation * 0.2)
-            daily_pressure_variation = np.random.normal(0, pressure_variation * 0.2)
-            
-            base_predicted_temp += daily_temp_variation
-            base_predicted_humidity += daily_humidity_variation
-            base_predicted_pressure += daily_pressure_variation
-
-            # Calculate day/night variations
-            # Day is considered from 6 AM to 6 PM (12 hours)
-            # Night is considered from 6 PM to 6 AM (12 hours)
-            prediction_date = current_date + timedelta(days=i)
-            hour = prediction_date.hour
-            
-            # Day/night temperature adjustment factor
-            if 6 <= hour < 18:  # Day time
-                min_scale = 2
-                max_scale = 0.5
-            else:  # Night time
-                min_scale = 0.5
-                max_scale = 2
-            
-            # Apply day/night variations to min and max temperatures
-            min_temp = base_predicted_temp - temp_variation * min_scale
-            max_temp = base_predicted_temp + temp_variation * max_scale
-            
-            # Ensure humidity stays within valid range
-            predicted_humidity = max(0, min(100, base_predicted_humidity))
-            
-            predictions.append({
-                'date': prediction_date.strftime('%Y-%m-%d'),
-                'min_temperature': round(min_temp, 2),
-                'max_temperature': round(max_temp, 2),
-                'humidity': round(predicted_humidity, 2),
-                'pressure': round(base_predicted_pressure, 2)
-            })
-
-        return predictions
-
-    def _print_forecast(self, forecast):
-        """Print the forecast in a formatted table"""
-        if not forecast:
+    def _log_forecast(self, forecast, level=logging.INFO):
+        """Log the forecast in a formatted table; the table is only built if the level is enabled"""
+        if not forecast or not logger.isEnabledFor(level):
             return
 
         # Get current time for the generation timestamp
         generation_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         
-        print("\n" + "=" * 60)
-        print(f"7-Day Weather Forecast (Generated at: {generation_time})")
-        print("=" * 60)
-        print(f"{'Date':<12} {'Min Temp':<10} {'Max Temp':<10} {'Humidity':<10} {'Pressure':<10}")
-        print("-" * 60)
-        
+        lines = [
+            "=" * 60,
+            f"7-Day Weather Forecast (Generated at: {generation_time})",
+            "=" * 60,
+            f"{'Date':<12} {'Min Temp':<10} {'Max Temp':<10} {'Humidity':<10} {'Pressure':<10}",
+            "-" * 60
+        ]
         for day in forecast:
-            print(f"{day['date']:<12} {day['min_temperature']:>6.1f}°C   {day['max_temperature']:>6.1f}°C   {day['humidity']:>6.1f}%    {day['pressure']:>6.1f} hPa")
-        print("=" * 60)
+            lines.append(f"{day['date']:<12} {day['min_temperature']:>6.1f}°C   {day['max_temperature']:>6.1f}°C   {day['humidity']:>6.1f}%    {day['pressure']:>6.1f} hPa")
+        lines.append("=" * 60)
+        logger.log(level, "\n%s", "\n".join(lines))
+
+    @staticmethod
+    def historical_date_range():
+        """Return the (start, end) dates of the 30-day archive window as API strings"""
+        # Use current date as end date
+        end_date = datetime.now() - timedelta(days=1)   # Last day
+        start_date = end_date - timedelta(days=29)  # 30 days back
+        return start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d')
+
+    def missing_date_ranges(self):
+        """Return the (start, end) date ranges of the 30-day archive window missing from the local history"""
+        start_str, end_str = self.historical_date_range()
+        missing = self.history.missing_hours(f"{start_str}T00", f"{end_str}T23")
+        days = np.unique(missing.astype('datetime64[D]'))
+        if len(days) == 0:
+            return []
+        # One request per run of missing days; runs less than 3 days apart are fetched together
+        runs = np.split(days, np.where(np.diff(days) > np.timedelta64(3, 'D'))[0] + 1)
+        return [(str(run[0]), str(run[-1])) for run in runs]
+
+    def sync_historical_data(self):
+        """Download only the archive hours missing from the local history.
 
-    def download_historical_data(self):
-        """Download and save complete historical weather data"""
+        Returns True if a local history is available afterwards, so startup works offline.
+        """
+        for start_str, end_str in self.missing_date_ranges():
+            logger.info("Syncing archive for %s (%s to %s)", self.city, start_str, end_str)
+            hourly_data = self.client.fetch_hourly_archive([self], start_str, end_str)[0]
+            if hourly_data is None:
+                logger.warning("Archive unavailable, continuing with local history")
+                continue
+            self.merge_historical_data(hourly_data)
+        return self.history.exists()
+
+    def merge_historical_data(self, hourly_data):
+        """Add the new, valid rows of an 'hourly' archive block to the local history"""
         try:
-            # Use current date as end date
-            end_date = datetime.now() - timedelta(days=1)   # Last day
-            start_date = end_date - timedelta(days=29)  # 30 days back
-            
-            # Format dates for API
-            start_str = start_date.strftime('%Y-%m-%d')
-            end_str = end_date.strftime('%Y-%m-%d')
-            
-            print(f"\nDuration: ({start_str} to {end_str})")
-            print(f"Expected readings: 720 (30 days × 24 hours)")
-            
-            # Make API request
-            url = self.archive_url
-            params = {
-                'latitude': self.latitude,
-                'longitude': self.longitude,
-                'start_date': start_str,
-                'end_date': end_str,
-                'hourly': 'temperature_2m,relative_humidity_2m,pressure_msl',
-                'timezone': self.timezone
-            }
-            
-            response = requests.get(url, params=params)
-            
-            if response.status_code != 200:
-                print(f"API Error: {response.text}")
-                return False
-                
-            data = response.json()
-            
-            if 'hourly' not in data:
-                print("Invalid API response format - 'hourly' data missing")
-                return False
-            
-            # Process hourly data
-            hourly_data = data['hourly']
-            timestamps = hourly_data['time']
-            temperatures = hourly_data['temperature_2m']
-            humidities = hourly_data['relative_humidity_2m']
-            pressures = hourly_data['pressure_msl']
-            
-            # Filter out any rows with None or NaN values
-            valid_data = []
-            invalid_count = 0
-            for i in range(len(timestamps)):
-                if (temperatures[i] is not None and 
-                    humidities[i] is not None and 
-                    pressures[i] is not None and
-                    not any(math.isnan(x) for x in [temperatures[i], humidities[i], pressures[i]])):
-                    valid_data.append({
-                        'timestamp': timestamps[i],
-                        'temperature': temperatures[i],
-                        'humidity': humidities[i],
-                        'pressure': pressures[i]
-                    })
-                else:
-                    invalid_count += 1
-            
-            print(f"Received: {len(timestamps)} readings")
-            print(f"Valid: {len(valid_data)} readings")
-            print(f"Invalid: {invalid_count} readings")
-            
-            # Create data directory if it doesn't exist
-            data_dir = "data"
-            if not os.path.exists(data_dir):
-                os.makedirs(data_dir)
-            
-            # Always use the same filename to overwrite
-            csv_filename = os.path.join(data_dir, "historical_weather_data.csv")
-            
-            with open(csv_filename, 'w', newline='') as csvfile:
-                fieldnames = ['timestamp', 'temperature', 'humidity', 'pressure']
-                writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-                
-                writer.writeheader()
-                writer.writerows(valid_data)
-            
+            timestamps, values, invalid_count = hourly_arrays(hourly_data)
+            added = self.history.merge(timestamps, values)
+            logger.info("Synced archive for %s: %d new readings, %d invalid, %d stored",
+                        self.city, added, invalid_count, len(self.history))
             return True
-            
-        except requests.exceptions.RequestException as e:
-            print(f"Network error while downloading historical data: {str(e)}")
-            return False
         except Exception as e:
-            print(f"Error downloading historical data: {str(e)}")
+            logger.error("Error merging historical data: %s", e)
             return False
 
     def fetch_initial_training_data(self):
-        """Fetch optimal volume of data for initial model training from the downloaded CSV file"""
+        """Load the latest readings from the local binary history into the store"""
         try:
-            print("\nFetching training data from CSV...")
-            
-            # Use the fixed CSV filename
-            data_dir = "data"
-            csv_filename = os.path.join(data_dir, "historical_weather_data.csv")
-            if not os.path.exists(csv_filename):
-                print("No historical data CSV file found")
+            if not self.history.exists():
+                logger.warning("No historical data file found for %s", self.city)
                 return False
             
-            # Read the CSV and load all valid data
-            self.historical_data = []
-            skipped_rows = 0
-            total_rows = 0
-            with open(csv_filename, 'r') as csvfile:
-                reader = csv.DictReader(csvfile)
-                for row_num, row in enumerate(reader, start=2):
-                    total_rows += 1
-                    try:
-                        # Skip rows with empty values
-                        if not all(row[field].strip() for field in ['timestamp', 'temperature', 'humidity', 'pressure']):
-                            skipped_rows += 1
-                            continue
-                            
-                        try:
-                            reading = {
-                                'created_at': row['timestamp'].strip(),
-                                'field1': float(row['temperature'].strip()),
-                                'field2': float(row['humidity'].strip()),
-                                'field3': float(row['pressure'].strip())
-                            }
-                            self.historical_data.append(reading)
-                        except ValueError:
-                            skipped_rows += 1
-                            continue
-                                
-                    except Exception:
-                        skipped_rows += 1
-                        continue
-            
-            print(f"Data summary:")
-            print(f"- Total rows: {total_rows}")
-            print(f"- Skipped rows: {skipped_rows}")
-            print(f"- Training data: {len(self.historical_data)} readings")
+            # Memory-mapped read: no parsing, the only copy is into the ring buffer
+            with HISTORY_LOAD_SECONDS.time():
+                timestamps, values = self.history.read(self.max_readings)
+                self.store.replace(timestamps, values)
+                self.features.reset(timestamps, values)
+            logger.info("Loaded %d of %d stored rows for %s", len(self.store), len(self.history), self.city)
             return True
             
         except Exception as e:
-            print(f"Error: {str(e)}")
+            logger.error("Error loading training data: %s", e)
+            return False
+
+    def is_follower(self):
+        """Return True if another worker process owns this location and publishes its state"""
+        return self.shared_state is not None and not self.shared_state.try_acquire_ownership()
+
+    def close(self):
+        """Release this location's shared state ownership (called when the predictor is evicted from the pool)"""
+        if self.shared_state is not None:
+            self.shared_state.release()
+
+    def publish_data(self):
+        """Publish the readings for other worker processes if this process owns the location"""
+        if self.shared_state is not None and self.shared_state.is_owner:
+            _, timestamps, values = self.store.snapshot(copy=True)
+            self.shared_state.publish_data(timestamps, values, self.last_reading_time)
+
+    def sync_shared_state(self, min_interval=1):
+        """Load the readings and model published by the owning process if they changed (followers only)"""
+        if self.shared_state is None or time.time() - self._last_sync < min_interval:
+            return False
+        self._last_sync = time.time()
+        if not self.is_follower():
             return False
 
+        data = self.shared_state.load_data()
+        if data is not None:
+            timestamps, values, last_reading_time = data
+            self.store.replace(timestamps, values)
+            self.features.reset(timestamps, values)
+            self.last_reading_time = last_reading_time
+        model = self.shared_state.load_model()
+        if model is not None:
+            self.model_registry.install(model)
+        # Followers push the owner's updates to their own stream subscribers
+        if data is not None:
+            self.broadcast_reading()
+        elif model is not None:
+            self.broadcast_forecast(model)
+        return data is not None or model is not None
+
+    def warm_up(self, hourly_data=None, fetch_current=True):
+        """Load the initial data for this location once; safe to call from several threads.
+
+        hourly_data can carry the archive blocks for missing_date_ranges() already fetched in a batch,
+        in which case the caller usually fetches the current reading in a batch as well (fetch_current=False).
+        """
+        if self.ready:
+            return True
+        if hourly_data is None and self.warm_up_local(fetch_current):
+            return True
+        with self._warm_up_lock:
+            if self.ready:
+                return True
+            if self.is_follower() and self._wait_for_owner():
+                self.ready = True
+                return True
+
+            logger.info("Warming up predictor for %s (%s, %s)...", self.city, self.latitude, self.longitude)
+            if hourly_data is not None:
+                for block in hourly_data:
+                    self.merge_historical_data(block)
+                synced = self.history.exists()
+            else:
+                synced = self.sync_historical_data()
+            if not (synced and self.fetch_initial_training_data()):
+                logger.error("Failed to warm up predictor for %s", self.city)
+                return False
+            if fetch_current:
+                # Seed the first live reading; the ingestion scheduler keeps it fresh afterwards
+                self.fetch_sensor_data()
+            self.publish_data()
+            self.ready = True
+            return True
+
+    def warm_up_local(self, fetch_current=True):
+        """Become ready from the persisted history alone, without any upstream call (FAST_STARTUP).
+
+        The persisted model is restored and the archive synced in the background; the current reading
+        is fetched there too unless the caller seeds it in a batch (fetch_current=False).
+        Returns False if there is no local history to start from.
+        """
+        if not self.fast_startup:
+            return False
+        with self._warm_up_lock:
+            if self.ready:
+                return True
+            if self.is_follower() or not self.history.exists() or not self.fetch_initial_training_data():
+                return False
+            self.model_registry.restore()
+            self.publish_data()
+            self.ready = True
+        threading.Thread(target=self.catch_up, args=(fetch_current,), daemon=True).start()
+        return True
+
+    def catch_up(self, fetch_current=True):
+        """Bring a predictor started from local state up to date with the upstream"""
+        if self.missing_date_ranges():
+            self.sync_historical_data()
+            self.fetch_initial_training_data()
+        if fetch_current:
+            self.fetch_sensor_data()
+        # Retrain in the background if the data moved past the restored model
+        self.model_registry.get_latest()
+
+    def _wait_for_owner(self):
+        """Wait until the owning process has published readings; False if we became the owner or timed out"""
+        logger.info("Waiting for the worker owning %s to publish its data...", self.city)
+        deadline = time.time() + self.shared_state_wait
+        while time.time() < deadline:
+            if not self.is_follower():
+                return False
+            self.sync_shared_state(min_interval=0)
+            if len(self.store) > 0:
+                return True
+            time.sleep(0.5)
+        return False
+
+    def refresh_and_forecast(self):
+        """Fetch a new reading and print the resulting forecast (one tick of run())"""
+        self.fetch_sensor_data()
+        forecast = self.predict_weather()
+        if forecast:
+            self._log_forecast(forecast)
+        else:
+            logger.error("Failed to generate forecast")
+
     def run(self):
         """Run the weather prediction system"""
         try:
-            print("\nInitializing Weather Prediction System...")
-            print(f"Location: {self.city} ({self.latitude}, {self.longitude})")
+            logger.info("Initializing Weather Prediction System...")
+            logger.info("Location: %s (%s, %s)", self.city, self.latitude, self.longitude)
             
-            # First, download and save complete historical data
-            print("\nStep 1: Downloading historical data...")
-            if not self.download_historical_data():
-                print("Failed to download historical data. Exiting...")
+            # First, bring the local historical data up to date
+            logger.info("Step 1: Syncing historical data...")
+            if not self.sync_historical_data():
+                logger.error("Failed to download historical data. Exiting...")
                 return
                 
             # Then, fetch optimal training data for initial prediction
-            print("\nStep 2: Fetching training data...")
+            logger.info("Step 2: Fetching training data...")
             if not self.fetch_initial_training_data():
-                print("Failed to fetch training data. Exiting...")
+                logger.error("Failed to fetch training data. Exiting...")
                 return
             
             # Fetch current sensor data before making prediction
-            print("\nStep 3: Fetching current sensor data...")
+            logger.info("Step 3: Fetching current sensor data...")
             if not self.fetch_sensor_data():
-                print("Failed to fetch current sensor data. Exiting...")
+                logger.error("Failed to fetch current sensor data. Exiting...")
                 return
                 
             # Make first prediction using training data
-            print("\nStep 4: Generating initial forecast...")
+            logger.info("Step 4: Generating initial forecast...")
             forecast = self.predict_weather()
             if forecast:
-                self._print_forecast(forecast)
+                self._log_forecast(forecast)
             else:
-                print("Failed to generate initial forecast. Exiting...")
+                logger.error("Failed to generate initial forecast. Exiting...")
                 return
             
-            print("\nSwitching to 300-second interval updates...")
-            
-            while True:
-                try:
-                    # Calculate time until next update
-                    current_time = datetime.now()
-                    next_update = current_time + timedelta(seconds=300)
-                    time_remaining = 300
-                    
-                    # Display countdown
-                    while time_remaining > 0:
-                        minutes = time_remaining // 60
-                        seconds = time_remaining % 60
-                        print(f"\rNext update in: {minutes:02d}:{seconds:02d}", end="", flush=True)
-                        time.sleep(1)
-                        time_remaining -= 1
-                    print("\r" + " " * 30 + "\r", end="", flush=True)  # Clear the countdown line
-                    
-                    self.fetch_sensor_data()
-                    forecast = self.predict_weather()
-                    if forecast:
-                        self._print_forecast(forecast)
-                    else:
-                        print("Failed to generate initial forecast. Exiting...")
-                        return
-                    
-                except KeyboardInterrupt:
-                    print("\nStopping weather prediction system...")
-                    break
-                except Exception as e:
-                    print(f"\nError in main loop: {str(e)}")
-                    time.sleep(5)  # Wait before retrying
+            # Refresh on the ingestion cadence (INGEST_INTERVAL, 300 seconds by default)
+            scheduler = IngestionScheduler(self.refresh_and_forecast)
+            logger.info("Switching to %d-second interval updates...", scheduler.interval)
+            try:
+                scheduler.run_forever()
+            except KeyboardInterrupt:
+                logger.info("Stopping weather prediction system...")
             
-        except Exception as e:
-            print(f"\nError in main function: {str(e)}")
-            import traceback
-            print(f"Traceback: {traceback.format_exc()}")
+        except Exception:
+            logger.exception("Error in main function")
             time.sleep(5)  # Wait before retrying
 
 if __name__ == "__main__":
+    logging.basicConfig(level=os.getenv('LOG_LEVEL', 'INFO').upper(), format='%(message)s')
     predictor = WeatherPredictor()
     predictor.run() 
\ No newline at end of file
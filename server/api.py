@@ -1,78 +1,105 @@
-from flask import Flask, jsonify
+from flask import Flask, Response, g, jsonify, request
 from flask_cors import CORS
-from ai_model.weather_predictor import WeatherPredictor
-import threading
-import time
-from datetime import datetime
+from ai_model.predictor_pool import PredictorPool
+from ai_model.ingestion import IngestionScheduler
+from weather_service import (ApiError, error_body, success_body, current_weather_data, forecast_data, readiness_data,
+                             current_weather_key, forecast_key, parse_batch_request, batch_forecast_data,
+                             accepts_msgpack, msgpack_body, MSGPACK_MIMETYPE, hourly_forecast_data, hourly_forecast_key,
+                             parse_hours, forecast_history_key, forecast_history_data, parse_limit)
+from response_cache import ResponseCache, cache_control, etag_matches
+from ai_model.resilience import get_default_guard
+from ai_model.metrics import REGISTRY, HTTP_REQUEST_SECONDS, CONTENT_TYPE as METRICS_CONTENT_TYPE
 from dotenv import load_dotenv
+import logging
 import os
+import threading
+import time
 
 # Load environment variables
 load_dotenv()
 
+# Console output is leveled: per-reading and per-request details only appear with LOG_LEVEL=DEBUG
+logging.basicConfig(level=os.getenv('LOG_LEVEL', 'INFO').upper(), format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+logger = logging.getLogger(__name__)
+
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
-weather_predictor = WeatherPredictor()
+predictor_pool = PredictorPool()  # One predictor per location, created on first request
+# Refreshes the readings of every pooled location in the background, so requests never hit the upstream
+ingestion_scheduler = IngestionScheduler(predictor_pool.refresh_current_weather)
+# Keeps the local archives current so restarts only download the last day
+archive_scheduler = IngestionScheduler(predictor_pool.sync_archives, int(os.getenv('ARCHIVE_SYNC_INTERVAL', 86400)))
+# Serialized responses per location and data/model version, revalidated with ETags
+response_cache = ResponseCache(ingestion_scheduler.interval)
+# Store sizes and cache occupancy are read when /metrics is scraped
+REGISTRY.add_collector(predictor_pool.collect_metrics)
+REGISTRY.add_collector(response_cache.collect_metrics)
+REGISTRY.add_collector(get_default_guard().collect_metrics)
 
 def initialize_weather_predictor():
-    """Initialize the weather predictor with historical data"""
-    print("Initializing weather predictor...")
-    if weather_predictor.download_historical_data():
-        print("Historical data downloaded successfully")
-        if weather_predictor.fetch_initial_training_data():
-            print("Initial training data fetched successfully")
-            return True
-    print("Failed to initialize weather predictor")
+    """Initialize the predictor of the default site with historical data"""
+    logger.info("Initializing weather predictor...")
+    if predictor_pool.get().ready:
+        logger.info("Initial training data fetched successfully")
+        return True
+    logger.error("Failed to initialize weather predictor")
     return False
 
+def get_request_predictor():
+    """Return the predictor for the location in the query string (?site=<id> or ?lat=<lat>&lon=<lon>)"""
+    try:
+        return predictor_pool.get(
+            site=request.args.get('site'),
+            latitude=request.args.get('lat'),
+            longitude=request.args.get('lon')
+        )
+    except ValueError as e:
+        raise ApiError(f'Invalid location: {str(e)}', 400)
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def observe_request_time(response):
+    """Record the handling time of every request, labelled by route (not by raw path, to bound the label values)"""
+    start = g.pop('request_start', None)
+    if start is not None:
+        endpoint = request.url_rule.rule if request.url_rule is not None else 'other'
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint=endpoint, status=response.status_code)
+    return response
+
 def create_error_response(message, status_code=500):
     """Create a consistent error response format"""
-    return jsonify({
-        'success': False,
-        'error': {
-            'message': message,
-            'code': status_code
-        }
-    }), status_code
+    return jsonify(error_body(message, status_code)), status_code
 
 def create_success_response(data, message=None):
     """Create a consistent success response format"""
-    response = {
-        'success': True,
-        'data': data
+    return jsonify(success_body(data, message))
+
+def create_cached_response(weather_predictor, key, build):
+    """Serve a success response from the response cache, answering a matching If-None-Match with 304"""
+    etag, body = response_cache.lookup(key, build)
+    headers = {
+        'ETag': f'"{etag}"',
+        'Cache-Control': cache_control(weather_predictor, ingestion_scheduler.interval)
     }
-    if message:
-        response['message'] = message
-    return jsonify(response)
+    if etag_matches(request.headers.get('If-None-Match'), etag):
+        return Response(status=304, headers=headers)
+    return Response(body, mimetype='application/json', headers=headers)
 
 @app.route('/api/current-weather', methods=['GET'])
 def get_current_weather():
     """Endpoint to get current weather data"""
     try:
-        # Fetch current sensor data
-        if not weather_predictor.fetch_sensor_data():
-            return create_error_response('Failed to fetch current weather data', 500)
-
-        # Get the latest reading from historical data
-        if not weather_predictor.historical_data:
-            return create_error_response('No weather data available yet', 404)
-
-        latest_reading = weather_predictor.historical_data[-1]
-        
-        # Calculate sky condition based on the latest reading
-        temp = float(latest_reading['field1'])
-        humidity = float(latest_reading['field2'])
-        pressure = float(latest_reading['field3'])
-        sky_condition = weather_predictor.calculate_sky_condition(temp, humidity, pressure)
-        
-        return create_success_response({
-            'temperature': temp,
-            'humidity': humidity,
-            'pressure': pressure,
-            'sky_condition': sky_condition,
-            'timestamp': latest_reading['created_at'],
-            'location': weather_predictor.city
-        })
+        weather_predictor = get_request_predictor()
+        return create_cached_response(
+            weather_predictor,
+            current_weather_key(weather_predictor, ingestion_scheduler.stale_after),
+            lambda: current_weather_data(weather_predictor, ingestion_scheduler.stale_after)
+        )
+    except ApiError as e:
+        return create_error_response(e.message, e.status_code)
     except Exception as e:
         return create_error_response(str(e), 500)
 
@@ -80,52 +107,123 @@ def get_current_weather():
 def get_weather_forecast():
     """Endpoint to get weather forecast"""
     try:
-        # First ensure we have enough data and train the model
-        if not weather_predictor.historical_data or len(weather_predictor.historical_data) < 240:
-            return create_error_response('Insufficient historical data for prediction. Need at least 240 readings.', 404)
-
-        # Train the model
-        if not weather_predictor.train_model():
-            return create_error_response('Failed to train the weather prediction model.', 500)
-
-        # Get predictions for next 7 days
-        forecast = weather_predictor.predict_weather()
-        
-        if not forecast:
-            return create_error_response('Unable to generate forecast. Prediction failed.', 404)
-
-        # Print the forecast in a formatted table
-        weather_predictor._print_forecast(forecast)
-
-        # Format the forecast data
-        formatted_forecast = []
-        for day in forecast:
-            formatted_forecast.append({
-                'date': day['date'],
-                'min_temperature': day['min_temperature'],
-                'max_temperature': day['max_temperature'],
-                'humidity': day['humidity'],
-                'pressure': day['pressure']
-            })
-
-        return create_success_response({
-            'forecast': formatted_forecast,
-            'generated_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        })
+        weather_predictor = get_request_predictor()
+        return create_cached_response(
+            weather_predictor,
+            forecast_key(weather_predictor),
+            lambda: forecast_data(weather_predictor)
+        )
+    except ApiError as e:
+        return create_error_response(e.message, e.status_code)
     except Exception as e:
-        print(f"Error in weather forecast: {str(e)}")  # Add logging
+        logger.error("Error in weather forecast: %s", e)
         return create_error_response(f'Failed to generate forecast: {str(e)}', 500)
 
-if __name__ == '__main__':
+@app.route('/api/hourly-forecast', methods=['GET'])
+def get_hourly_forecast():
+    """Endpoint to get an hourly forecast (?hours=1-168, 168 by default)"""
+    try:
+        hours = parse_hours(request.args.get('hours'))
+        weather_predictor = get_request_predictor()
+        return create_cached_response(
+            weather_predictor,
+            hourly_forecast_key(weather_predictor, hours),
+            lambda: hourly_forecast_data(weather_predictor, hours)
+        )
+    except ApiError as e:
+        return create_error_response(e.message, e.status_code)
+    except Exception as e:
+        logger.error("Error in hourly forecast: %s", e)
+        return create_error_response(f'Failed to generate forecast: {str(e)}', 500)
+
+@app.route('/api/forecast-history', methods=['GET'])
+def get_forecast_history():
+    """Endpoint to list the latest materialized forecasts, newest first (?limit=, 24 by default)"""
+    try:
+        weather_predictor = get_request_predictor()
+        limit = parse_limit(request.args.get('limit'), weather_predictor.forecast_history.capacity)
+        return create_cached_response(
+            weather_predictor,
+            forecast_history_key(weather_predictor, limit),
+            lambda: forecast_history_data(weather_predictor, limit)
+        )
+    except ApiError as e:
+        return create_error_response(e.message, e.status_code)
+    except Exception as e:
+        logger.error("Error in forecast history: %s", e)
+        return create_error_response(f'Failed to load forecast history: {str(e)}', 500)
+
+@app.route('/api/forecasts', methods=['POST'])
+def post_batch_forecast():
+    """Endpoint to forecast many locations, each with an optional horizon, in one batched model pass"""
+    try:
+        locations, horizons, layout = parse_batch_request(request.get_json(silent=True), predictor_pool.resolve)
+        weather_predictors = predictor_pool.warm_up_many(locations)
+        data = batch_forecast_data(weather_predictors, horizons, layout)
+        if accepts_msgpack(request.headers.get('Accept')):
+            return Response(msgpack_body(success_body(data)), mimetype=MSGPACK_MIMETYPE)
+        return create_success_response(data)
+    except ApiError as e:
+        return create_error_response(e.message, e.status_code)
+    except Exception as e:
+        logger.error("Error in batch forecast: %s", e)
+        return create_error_response(f'Failed to generate forecasts: {str(e)}', 500)
+
+@app.route('/api/stream', methods=['GET'])
+def get_stream():
+    """Server-Sent Events stream pushing each new reading ('reading') and forecast ('forecast') of a location"""
+    try:
+        weather_predictor = get_request_predictor()
+    except ApiError as e:
+        return create_error_response(e.message, e.status_code)
+    # Reconnecting clients resume after the last event they saw; new ones start with the latest reading
+    last_event_id = request.headers.get('Last-Event-ID')
+    first = weather_predictor.initial_stream_event() if last_event_id is None else None
+    return Response(
+        weather_predictor.updates.stream(last_event_id, first),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/api/ready', methods=['GET'])
+def get_readiness():
+    """Readiness probe: 200 once the default site serves readings, 503 while it is still warming up"""
+    readiness = readiness_data(predictor_pool.get(warm_up=False))
+    if not readiness['data_ready']:
+        body = error_body('Weather predictor is warming up', 503)
+        body['data'] = readiness
+        return jsonify(body), 503
+    return create_success_response(readiness)
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus metrics: hot-path timings, cache hit counts and store sizes of this process"""
+    return Response(REGISTRY.render(), content_type=METRICS_CONTENT_TYPE)
+
+def warm_up_and_schedule():
+    """Initialize the default site, then start the ingestion and archive schedulers"""
     # Initialize the weather predictor with historical data
     if initialize_weather_predictor():
-        print("Weather predictor initialized successfully")
+        logger.info("Weather predictor initialized successfully")
     else:
-        print("Warning: Weather predictor initialization failed")
+        logger.warning("Weather predictor initialization failed")
+    ingestion_scheduler.start()
+    archive_scheduler.start()
+
+def start_background_work():
+    """Warm up and start ingestion in a background thread so the server binds immediately (also called by gunicorn workers)"""
+    threading.Thread(target=warm_up_and_schedule, daemon=True).start()
+
+if __name__ == '__main__':
+    debug = os.getenv('FLASK_DEBUG', 'True').lower() == 'true'
+    # In debug mode the reloader's parent process only watches files; the child it starts serves requests
+    # (WERKZEUG_RUN_MAIN is set there), so only that one ingests and trains
+    if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_background_work()
     
     # Start the Flask server using environment variables
     app.run(
         host=os.getenv('FLASK_HOST', '0.0.0.0'),
         port=int(os.getenv('FLASK_PORT', 8080)),
-        debug=os.getenv('FLASK_DEBUG', 'True').lower() == 'true'
+        debug=debug
     ) 
\ No newline at end of file
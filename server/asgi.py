@@ -0,0 +1,372 @@
+import asyncio
+import contextlib
+import functools
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+from ai_model.predictor_pool import PredictorPool, missing_range_groups
+from ai_model.ingestion import IngestionScheduler
+from ai_model.open_meteo import AsyncOpenMeteoClient
+from weather_service import (ApiError, error_body, success_body, current_weather_data, forecast_data, readiness_data,
+                             current_weather_key, forecast_key, parse_batch_request, batch_forecast_data,
+                             accepts_msgpack, msgpack_body, MSGPACK_MIMETYPE, hourly_forecast_data, hourly_forecast_key,
+                             parse_hours, forecast_history_key, forecast_history_data, parse_limit)
+from response_cache import ResponseCache, cache_control, etag_matches
+from ai_model.resilience import get_default_guard
+from ai_model.metrics import REGISTRY, HTTP_REQUEST_SECONDS, CONTENT_TYPE as METRICS_CONTENT_TYPE
+
+# Load environment variables
+load_dotenv()
+
+# Console output is leveled: per-reading and per-request details only appear with LOG_LEVEL=DEBUG
+logging.basicConfig(level=os.getenv('LOG_LEVEL', 'INFO').upper(), format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+logger = logging.getLogger(__name__)
+# httpx logs every upstream request at INFO; keep those for LOG_LEVEL=DEBUG
+logging.getLogger('httpx').setLevel(max(logging.WARNING, logging.getLogger().level))
+
+predictor_pool = PredictorPool()  # One predictor per location, created on first request
+# Model training and prediction run here so they never block the event loop
+model_executor = ThreadPoolExecutor(max_workers=int(os.getenv('MODEL_WORKERS', os.cpu_count() or 1)))
+upstream = None         # AsyncOpenMeteoClient, created when the app starts
+_warm_ups = {}          # Location key -> task warming that location up
+
+def create_error_response(message, status_code=500):
+    """Create a consistent error response format"""
+    return JSONResponse(error_body(message, status_code), status_code=status_code)
+
+def create_success_response(data, message=None):
+    """Create a consistent success response format"""
+    return JSONResponse(success_body(data, message))
+
+def create_cached_response(request, weather_predictor, etag, body):
+    """Build the response for a cached body, answering a matching If-None-Match with 304"""
+    headers = {
+        'ETag': f'"{etag}"',
+        'Cache-Control': cache_control(weather_predictor, ingestion_scheduler.interval)
+    }
+    if etag_matches(request.headers.get('if-none-match'), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type='application/json', headers=headers)
+
+async def run_in_worker(func, *args):
+    """Run CPU-bound work on the model worker pool"""
+    return await asyncio.get_running_loop().run_in_executor(model_executor, func, *args)
+
+async def _warm_up(weather_predictor):
+    """Download the archive and first reading of a location without blocking the event loop"""
+    if weather_predictor.shared_state is not None and weather_predictor.is_follower():
+        # Another worker process owns this location; wait for its published data on the worker pool
+        return await run_in_worker(weather_predictor.warm_up)
+    if await run_in_worker(weather_predictor.warm_up_local):
+        return True
+
+    archives = await fetch_missing_archives([weather_predictor])
+    if not await run_in_worker(weather_predictor.warm_up, archives[id(weather_predictor)], False):
+        return False
+    await run_in_worker(record_readings, [weather_predictor], await upstream.fetch_current([weather_predictor]))
+    return True
+
+def record_readings(predictors, currents):
+    """Record fetched readings, materializing the forecasts they lead to (runs on the worker pool)"""
+    for predictor, current in zip(predictors, currents):
+        if current is not None:
+            predictor.record_current(current)
+
+async def fetch_missing_archives(predictors):
+    """Fetch the archive ranges missing for each predictor; returns {id(predictor): [hourly blocks]}"""
+    archives = {id(predictor): [] for predictor in predictors}
+    groups = await run_in_worker(missing_range_groups, predictors)
+    for (start_str, end_str), group in groups.items():
+        for predictor, hourly_data in zip(group, await upstream.fetch_hourly_archive(group, start_str, end_str)):
+            if hourly_data is not None:
+                archives[id(predictor)].append(hourly_data)
+    return archives
+
+async def sync_archives():
+    """Bring the local archive of every owned location up to date, fetching only missing ranges"""
+    predictors = await run_in_worker(predictor_pool.owned_predictors)
+    archives = await fetch_missing_archives(predictors)
+    for predictor in predictors:
+        for hourly_data in archives[id(predictor)]:
+            await run_in_worker(predictor.merge_historical_data, hourly_data)
+
+async def warm_up(weather_predictor):
+    """Warm up a location once, sharing the work between concurrent requests"""
+    if weather_predictor.ready:
+        return True
+    task = _warm_ups.get(weather_predictor.location_key)
+    if task is None:
+        task = _track_warm_up(asyncio.ensure_future(_warm_up(weather_predictor)), [weather_predictor])
+    return await task
+
+def _track_warm_up(task, predictors):
+    """Register a warm-up task for its locations until it finishes, so concurrent requests await it"""
+    def untrack(_, key):
+        if _warm_ups.get(key) is task:
+            del _warm_ups[key]
+
+    for predictor in predictors:
+        _warm_ups[predictor.location_key] = task
+        task.add_done_callback(functools.partial(untrack, key=predictor.location_key))
+    return task
+
+async def _warm_up_batch(predictors):
+    """Warm up several locations, fetching their archives and first readings in batched upstream calls"""
+    followers = [p for p in predictors if p.shared_state is not None and p.is_follower()]
+    others = [p for p in predictors if p not in followers]
+    # Followers wait for their owners' data; locations with a local history start from it
+    await asyncio.gather(*(run_in_worker(p.warm_up) for p in followers))
+    warmed = await run_in_worker(lambda: [p for p in others if p.warm_up_local(fetch_current=False)])
+    cold = [p for p in others if not p.ready]
+    if cold:
+        archives = await fetch_missing_archives(cold)
+        warmed += await run_in_worker(lambda: [p for p in cold if p.warm_up(archives[id(p)], False)])
+    if warmed:
+        await run_in_worker(record_readings, warmed, await upstream.fetch_current(warmed))
+
+async def warm_up_many(weather_predictors):
+    """Warm up several locations at once, joining warm-ups already running for some of them"""
+    pending = set()
+    cold = []
+    for weather_predictor in weather_predictors:
+        if weather_predictor.ready:
+            continue
+        task = _warm_ups.get(weather_predictor.location_key)
+        if task is not None:
+            pending.add(task)
+        elif weather_predictor not in cold:
+            cold.append(weather_predictor)
+    if cold:
+        pending.add(_track_warm_up(asyncio.ensure_future(_warm_up_batch(cold)), cold))
+    await asyncio.gather(*pending)
+
+async def refresh_current_weather():
+    """Fetch current conditions for every owned location in batched calls and record them"""
+    predictors = await run_in_worker(predictor_pool.owned_predictors)
+    # One hop to the worker pool for all locations: recording hashes the data and predicts the forecast
+    await run_in_worker(record_readings, predictors, await upstream.fetch_current(predictors))
+
+ingestion_scheduler = IngestionScheduler(refresh_current_weather)
+archive_scheduler = IngestionScheduler(sync_archives, int(os.getenv('ARCHIVE_SYNC_INTERVAL', 86400)))
+# Serialized responses per location and data/model version, revalidated with ETags
+response_cache = ResponseCache(ingestion_scheduler.interval)
+# Store sizes and cache occupancy are read when /metrics is scraped
+REGISTRY.add_collector(predictor_pool.collect_metrics)
+REGISTRY.add_collector(response_cache.collect_metrics)
+REGISTRY.add_collector(get_default_guard().collect_metrics)
+
+async def get_request_predictor(request):
+    """Return the warmed-up predictor for the location in the query string"""
+    try:
+        weather_predictor = predictor_pool.get(
+            site=request.query_params.get('site'),
+            latitude=request.query_params.get('lat'),
+            longitude=request.query_params.get('lon'),
+            warm_up=False
+        )
+    except ValueError as e:
+        raise ApiError(f'Invalid location: {str(e)}', 400)
+    await warm_up(weather_predictor)
+    if weather_predictor.shared_state is not None:
+        await run_in_worker(weather_predictor.sync_shared_state)
+    return weather_predictor
+
+async def get_current_weather(request):
+    """Endpoint to get current weather data"""
+    try:
+        weather_predictor = await get_request_predictor(request)
+        etag, body = response_cache.lookup(
+            current_weather_key(weather_predictor, ingestion_scheduler.stale_after),
+            lambda: current_weather_data(weather_predictor, ingestion_scheduler.stale_after)
+        )
+        return create_cached_response(request, weather_predictor, etag, body)
+    except ApiError as e:
+        return create_error_response(e.message, e.status_code)
+    except Exception as e:
+        return create_error_response(str(e), 500)
+
+async def get_weather_forecast(request):
+    """Endpoint to get weather forecast"""
+    try:
+        weather_predictor = await get_request_predictor(request)
+        # Cache misses predict (or train) on the worker pool
+        etag, body = await run_in_worker(
+            response_cache.lookup, forecast_key(weather_predictor), lambda: forecast_data(weather_predictor)
+        )
+        return create_cached_response(request, weather_predictor, etag, body)
+    except ApiError as e:
+        return create_error_response(e.message, e.status_code)
+    except Exception as e:
+        logger.error("Error in weather forecast: %s", e)
+        return create_error_response(f'Failed to generate forecast: {str(e)}', 500)
+
+async def get_hourly_forecast(request):
+    """Endpoint to get an hourly forecast (?hours=1-168, 168 by default)"""
+    try:
+        hours = parse_hours(request.query_params.get('hours'))
+        weather_predictor = await get_request_predictor(request)
+        etag, body = await run_in_worker(
+            response_cache.lookup,
+            hourly_forecast_key(weather_predictor, hours),
+            lambda: hourly_forecast_data(weather_predictor, hours)
+        )
+        return create_cached_response(request, weather_predictor, etag, body)
+    except ApiError as e:
+        return create_error_response(e.message, e.status_code)
+    except Exception as e:
+        logger.error("Error in hourly forecast: %s", e)
+        return create_error_response(f'Failed to generate forecast: {str(e)}', 500)
+
+async def get_forecast_history(request):
+    """Endpoint to list the latest materialized forecasts, newest first (?limit=, 24 by default)"""
+    try:
+        weather_predictor = await get_request_predictor(request)
+        limit = parse_limit(request.query_params.get('limit'), weather_predictor.forecast_history.capacity)
+        # The history file is read on the worker pool when another process appended to it
+        etag, body = await run_in_worker(
+            lambda: response_cache.lookup(forecast_history_key(weather_predictor, limit),
+                                          lambda: forecast_history_data(weather_predictor, limit))
+        )
+        return create_cached_response(request, weather_predictor, etag, body)
+    except ApiError as e:
+        return create_error_response(e.message, e.status_code)
+    except Exception as e:
+        logger.error("Error in forecast history: %s", e)
+        return create_error_response(f'Failed to load forecast history: {str(e)}', 500)
+
+def _batch_forecast(weather_predictors, horizons, layout):
+    """Pick up state published by other workers, then forecast all locations (runs on the worker pool)"""
+    for weather_predictor in weather_predictors:
+        weather_predictor.sync_shared_state()
+    return batch_forecast_data(weather_predictors, horizons, layout)
+
+async def post_batch_forecast(request):
+    """Endpoint to forecast many locations, each with an optional horizon, in one batched model pass"""
+    try:
+        try:
+            body = await request.json()
+        except ValueError:
+            body = None
+        locations, horizons, layout = parse_batch_request(body, predictor_pool.resolve)
+        weather_predictors = [predictor_pool.get(warm_up=False, **location) for location in locations]
+        await warm_up_many(weather_predictors)
+        data = await run_in_worker(_batch_forecast, weather_predictors, horizons, layout)
+        if accepts_msgpack(request.headers.get('accept')):
+            return Response(msgpack_body(success_body(data)), media_type=MSGPACK_MIMETYPE)
+        return create_success_response(data)
+    except ApiError as e:
+        return create_error_response(e.message, e.status_code)
+    except Exception as e:
+        logger.error("Error in batch forecast: %s", e)
+        return create_error_response(f'Failed to generate forecasts: {str(e)}', 500)
+
+async def get_stream(request):
+    """Server-Sent Events stream pushing each new reading ('reading') and forecast ('forecast') of a location"""
+    try:
+        weather_predictor = await get_request_predictor(request)
+    except ApiError as e:
+        return create_error_response(e.message, e.status_code)
+    # Reconnecting clients resume after the last event they saw; new ones start with the latest reading
+    last_event_id = request.headers.get('last-event-id')
+    first = weather_predictor.initial_stream_event() if last_event_id is None else None
+    return StreamingResponse(
+        weather_predictor.updates.stream_async(last_event_id, first),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+async def get_readiness(request):
+    """Readiness probe: 200 once the default site serves readings, 503 while it is still warming up"""
+    readiness = readiness_data(predictor_pool.get(warm_up=False))
+    if not readiness['data_ready']:
+        body = error_body('Weather predictor is warming up', 503)
+        body['data'] = readiness
+        return JSONResponse(body, status_code=503)
+    return create_success_response(readiness)
+
+async def get_metrics(request):
+    """Prometheus metrics: hot-path timings, cache hit counts and store sizes of this process"""
+    return Response(REGISTRY.render(), headers={'Content-Type': METRICS_CONTENT_TYPE})
+
+async def initialize_weather_predictor():
+    """Warm up the default site; runs as a task so the server accepts connections meanwhile"""
+    logger.info("Initializing weather predictor...")
+    if await warm_up(predictor_pool.get(warm_up=False)):
+        logger.info("Weather predictor initialized successfully")
+    else:
+        logger.warning("Weather predictor initialization failed")
+
+class RequestTimingMiddleware:
+    """ASGI middleware recording the time to the start of each response, labelled by route path"""
+    def __init__(self, app):
+        self.app = app
+        self.route_paths = None     # Known route paths; anything else is labelled 'other' to bound the label values
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        if self.route_paths is None:
+            self.route_paths = {route.path for route in scope['app'].routes}
+        endpoint = scope['path'] if scope['path'] in self.route_paths else 'other'
+        start = time.perf_counter()
+
+        async def send_timed(message):
+            if message['type'] == 'http.response.start':
+                HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint=endpoint, status=message['status'])
+            await send(message)
+
+        await self.app(scope, receive, send_timed)
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    """Open the upstream client, start warming up the default site and run the ingestion loops"""
+    global upstream
+    upstream = AsyncOpenMeteoClient()
+    init_task = asyncio.create_task(initialize_weather_predictor())
+    ingestion_task = asyncio.create_task(ingestion_scheduler.run_async())
+    archive_task = asyncio.create_task(archive_scheduler.run_async())
+    try:
+        yield
+    finally:
+        ingestion_scheduler.stop()
+        archive_scheduler.stop()
+        init_task.cancel()
+        ingestion_task.cancel()
+        archive_task.cancel()
+        await upstream.close()
+        model_executor.shutdown(wait=False)
+
+app = Starlette(
+    routes=[
+        Route('/api/current-weather', get_current_weather, methods=['GET']),
+        Route('/api/weather-forecast', get_weather_forecast, methods=['GET']),
+        Route('/api/hourly-forecast', get_hourly_forecast, methods=['GET']),
+        Route('/api/forecast-history', get_forecast_history, methods=['GET']),
+        Route('/api/forecasts', post_batch_forecast, methods=['POST']),
+        Route('/api/stream', get_stream, methods=['GET']),
+        Route('/api/ready', get_readiness, methods=['GET']),
+        Route('/metrics', get_metrics, methods=['GET'])
+    ],
+    middleware=[
+        Middleware(CORSMiddleware, allow_origins=['*']),  # Enable CORS for all routes
+        Middleware(RequestTimingMiddleware)
+    ],
+    lifespan=lifespan
+)
+
+if __name__ == '__main__':
+    import uvicorn
+
+    # Start the ASGI server using the same environment variables as the Flask server
+    uvicorn.run(
+        app,
+        host=os.getenv('FLASK_HOST', '0.0.0.0'),
+        port=int(os.getenv('FLASK_PORT', 8080))
+    )
@@ -0,0 +1,158 @@
+"""Local stand-in for the Open-Meteo forecast and archive APIs, serving synthetic data.
+
+Run standalone with `python -m benchmarks.fake_upstream --port 8765 --latency-ms 50`, then point
+WEATHER_API_BASE_URL at http://127.0.0.1:8765/v1 and WEATHER_ARCHIVE_API_URL at
+http://127.0.0.1:8765/v1/archive.
+"""
+import argparse
+import json
+import math
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+
+def synthetic_hourly(latitude, start_date, end_date, hours=None, missing_ratio=0.0):
+    """Build an 'hourly' block with daily cycles, from start_date 00:00 to end_date 23:00.
+
+    hours caps the number of rows (to test payload sizes independently of the dates); missing_ratio
+    replaces that share of values with None, as the archive does for recent hours.
+    """
+    start = datetime.strptime(start_date, '%Y-%m-%d')
+    end = datetime.strptime(end_date, '%Y-%m-%d') + timedelta(hours=23)
+    count = int((end - start).total_seconds() // 3600) + 1
+    if hours is not None:
+        count = min(count, hours)
+
+    rng = random.Random(f"{latitude}:{start_date}")    # Same request, same data
+    block = {'time': [], 'temperature_2m': [], 'relative_humidity_2m': [], 'pressure_msl': []}
+    for step in range(count):
+        moment = start + timedelta(hours=step)
+        angle = moment.hour / 24 * 2 * math.pi
+        block['time'].append(moment.strftime('%Y-%m-%dT%H:%M'))
+        block['temperature_2m'].append(round(25 + 5 * math.sin(angle) + latitude / 100 + rng.random(), 1))
+        block['relative_humidity_2m'].append(round(70 + 10 * math.cos(angle) + rng.random(), 1))
+        block['pressure_msl'].append(round(1005 + 3 * math.sin(moment.toordinal() / 3) + rng.random(), 1))
+    if missing_ratio:
+        for field in ('temperature_2m', 'relative_humidity_2m', 'pressure_msl'):
+            values = block[field]
+            for index in rng.sample(range(count), int(count * missing_ratio)):
+                values[index] = None
+    return block
+
+
+def synthetic_current(latitude):
+    """Build a 'current' block"""
+    return {
+        'time': datetime.now().strftime('%Y-%m-%dT%H:%M'),
+        'temperature_2m': round(28.0 + latitude / 100 + random.random(), 1),
+        'relative_humidity_2m': round(70 + random.random() * 5, 1),
+        'pressure_msl': round(1006 + random.random(), 1)
+    }
+
+
+class FakeOpenMeteo:
+    """Threaded HTTP server answering /v1/forecast and /v1/archive like Open-Meteo, including batched coordinates.
+
+    latency_ms (plus up to jitter_ms) is slept before each response; archive_hours caps the rows of
+    archive responses; error_rate is the share of requests answered with 503, to exercise retries and
+    the circuit breaker; requests counts the calls served, by path.
+    """
+    def __init__(self, port=0, latency_ms=0, jitter_ms=0, archive_hours=None, missing_ratio=0.0, error_rate=0.0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.archive_hours = archive_hours
+        self.missing_ratio = missing_ratio
+        self.error_rate = error_rate
+        self.requests = {}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.port}/v1"
+
+    @property
+    def archive_url(self):
+        return f"{self.base_url}/archive"
+
+    def start(self):
+        """Serve in a daemon thread"""
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def respond(self, path, query):
+        """Return the JSON payload for a request"""
+        latitudes = [float(value) for value in query['latitude'][0].split(',')]
+        results = []
+        for latitude in latitudes:
+            if path.endswith('/archive'):
+                hourly = synthetic_hourly(latitude, query['start_date'][0], query['end_date'][0],
+                                          self.archive_hours, self.missing_ratio)
+                results.append({'latitude': latitude, 'hourly': hourly})
+            else:
+                results.append({'latitude': latitude, 'current': synthetic_current(latitude)})
+        # Like Open-Meteo, a single location comes back as an object and several as a list
+        return results if len(results) > 1 else results[0]
+
+    def _handler_class(self):
+        upstream = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                with upstream._lock:
+                    upstream.requests[url.path] = upstream.requests.get(url.path, 0) + 1
+                delay = upstream.latency_ms + random.random() * upstream.jitter_ms
+                if delay:
+                    time.sleep(delay / 1000)
+                try:
+                    if random.random() < upstream.error_rate:
+                        raise RuntimeError("Injected upstream failure")
+                    body = json.dumps(upstream.respond(url.path, parse_qs(url.query))).encode()
+                    status = 200
+                except RuntimeError as e:
+                    body = json.dumps({'error': True, 'reason': str(e)}).encode()
+                    status = 503
+                except (KeyError, ValueError) as e:
+                    body = json.dumps({'error': True, 'reason': str(e)}).encode()
+                    status = 400
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency-ms', type=float, default=0)
+    parser.add_argument('--jitter-ms', type=float, default=0)
+    parser.add_argument('--archive-hours', type=int, default=None)
+    parser.add_argument('--missing-ratio', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    args = parser.parse_args()
+    server = FakeOpenMeteo(args.port, args.latency_ms, args.jitter_ms, args.archive_hours, args.missing_ratio,
+                           args.error_rate)
+    print(f"Fake Open-Meteo listening on {server.base_url}")
+    server._server.serve_forever()
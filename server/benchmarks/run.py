@@ -0,0 +1,241 @@
+"""Offline benchmark suite: startup, training, forecast latency and API throughput against a fake upstream.
+
+Run from the server directory with `python -m benchmarks.run`; nothing leaves the machine. Every run
+starts from an empty temporary data directory, so results are comparable between commits.
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+
+from benchmarks.fake_upstream import FakeOpenMeteo
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENDPOINTS = ['/api/current-weather', '/api/weather-forecast', '/api/hourly-forecast']
+
+
+def percentiles(seconds):
+    """Summarize durations in milliseconds"""
+    ms = np.asarray(seconds) * 1000
+    return {
+        'count': len(ms),
+        'mean_ms': round(float(ms.mean()), 3),
+        'p50_ms': round(float(np.percentile(ms, 50)), 3),
+        'p95_ms': round(float(np.percentile(ms, 95)), 3),
+        'p99_ms': round(float(np.percentile(ms, 99)), 3)
+    }
+
+
+def timed(function, repeat):
+    """Call function repeat times and return the duration of each call"""
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def wait_for(condition, timeout=300):
+    """Poll until condition() is true; returns the seconds waited"""
+    start = time.perf_counter()
+    while not condition():
+        if time.perf_counter() - start > timeout:
+            raise TimeoutError("Timed out waiting for the predictor")
+        time.sleep(0.005)
+    return time.perf_counter() - start
+
+
+def bench_startup(data_dir):
+    """Cold start (archive download and training) and warm restart (local history and saved model)"""
+    from ai_model.weather_predictor import WeatherPredictor
+
+    start = time.perf_counter()
+    predictor = WeatherPredictor(data_dir=data_dir)
+    ready = predictor.warm_up()
+    cold_ready = time.perf_counter() - start
+    if not ready or not predictor.train_model():
+        raise RuntimeError("Cold start failed; is the fake upstream reachable?")
+    cold_model = time.perf_counter() - start
+
+    start = time.perf_counter()
+    restarted = WeatherPredictor(data_dir=data_dir)
+    restarted.warm_up()
+    warm_ready = time.perf_counter() - start
+    wait_for(lambda: restarted.model_registry.current is not None)
+    warm_model = time.perf_counter() - start
+
+    return predictor, {
+        'cold_ready_s': round(cold_ready, 3),
+        'cold_model_s': round(cold_model, 3),
+        'warm_ready_s': round(warm_ready, 3),
+        'warm_model_s': round(warm_model, 3)
+    }
+
+
+def bench_training(predictor, repeat):
+    """Time fit_models on the predictor's training window"""
+    data = predictor.training_snapshot(copy=True)
+    stats = []
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        _, _, fit_stats = predictor.fit_models(data)
+        durations.append(time.perf_counter() - start)
+        stats.append(fit_stats)
+    result = percentiles(durations)
+    result['rows'] = len(data[0])
+    result['trees'] = stats[-1]['trees']
+    result['model_mb'] = round(stats[-1]['model_bytes'] / 1e6, 2)
+    if 'hourly' in stats[-1]:
+        result['hourly_rows'] = stats[-1]['hourly']['rows']
+    return result
+
+
+def bench_inference(predictor, repeat):
+    """Time the daily and hourly forecasts of the served model"""
+    model = predictor.model_registry.get_latest(wait=True)
+    results = {'daily': percentiles(timed(lambda: predictor.predict_weather(model), repeat))}
+    if predictor.predict_hourly_weather(model) is not None:
+        results['hourly'] = percentiles(timed(lambda: predictor.predict_hourly_weather(model), repeat))
+    return results
+
+
+def load_client(base_url, path, requests_per_worker, concurrency):
+    """Send requests_per_worker GETs from each of `concurrency` threads; returns throughput and latency"""
+    def worker():
+        session = requests.Session()
+        durations = []
+        errors = 0
+        for _ in range(requests_per_worker):
+            start = time.perf_counter()
+            response = session.get(base_url + path)
+            durations.append(time.perf_counter() - start)
+            errors += response.status_code != 200
+        session.close()
+        return durations, errors
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        results = list(executor.map(lambda _: worker(), range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    durations = [duration for worker_durations, _ in results for duration in worker_durations]
+    summary = percentiles(durations)
+    summary['rps'] = round(len(durations) / elapsed, 1)
+    summary['errors'] = sum(errors for _, errors in results)
+    return summary
+
+
+def bench_api(concurrency_levels, requests_per_worker):
+    """Serve the Flask app on a local threaded server and load each endpoint at every concurrency level"""
+    from werkzeug.serving import make_server
+    import api
+
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)   # No access log line per request
+    if not api.initialize_weather_predictor():
+        raise RuntimeError("API warm-up failed")
+    api.predictor_pool.get().train_model()
+
+    server = make_server('127.0.0.1', 0, api.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    try:
+        results = {}
+        for path in ENDPOINTS:
+            requests.get(base_url + path)   # Fill the response cache
+            results[path] = {
+                concurrency: load_client(base_url, path, requests_per_worker, concurrency)
+                for concurrency in concurrency_levels
+            }
+        return results
+    finally:
+        server.shutdown()
+
+
+def print_table(title, rows, columns):
+    """Print a list of dicts as an aligned table"""
+    print(f"\n{title}")
+    widths = [max(len(column), *(len(str(row.get(column, ''))) for row in rows)) for column in columns]
+    print("  ".join(column.ljust(width) for column, width in zip(columns, widths)))
+    for row in rows:
+        print("  ".join(str(row.get(column, '')).ljust(width) for column, width in zip(columns, widths)))
+
+
+def report(results):
+    latency_columns = ['p50_ms', 'p95_ms', 'p99_ms', 'mean_ms', 'count']
+    print_table("Startup (seconds)", [results['startup']], list(results['startup']))
+    print_table("Training (fit_models)", [results['training']], list(results['training']))
+    print_table("Forecast latency", [dict(name=name, **stats) for name, stats in results['inference'].items()],
+                ['name'] + latency_columns)
+    if 'api' in results:
+        rows = [
+            dict(endpoint=path, concurrency=concurrency, **stats)
+            for path, levels in results['api'].items() for concurrency, stats in levels.items()
+        ]
+        print_table("API throughput", rows, ['endpoint', 'concurrency', 'rps', 'errors'] + latency_columns)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--latency-ms', type=float, default=0, help="Upstream response delay")
+    parser.add_argument('--jitter-ms', type=float, default=0, help="Extra random upstream delay, up to this much")
+    parser.add_argument('--archive-hours', type=int, default=None, help="Cap on rows per archive response")
+    parser.add_argument('--missing-ratio', type=float, default=0.0, help="Share of archive values returned as null")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Share of upstream requests failing with 503")
+    parser.add_argument('--repeat', type=int, default=200, help="Calls per forecast latency measurement")
+    parser.add_argument('--train-repeat', type=int, default=3, help="fit_models calls to time")
+    parser.add_argument('--concurrency', default='1,4,16', help="Comma-separated client thread counts")
+    parser.add_argument('--requests', type=int, default=100, help="Requests per client thread")
+    parser.add_argument('--skip-api', action='store_true', help="Skip the HTTP throughput runs")
+    parser.add_argument('--json', metavar='FILE', help="Also write the results as JSON ('-' for stdout)")
+    args = parser.parse_args()
+
+    upstream = FakeOpenMeteo(0, args.latency_ms, args.jitter_ms, args.archive_hours, args.missing_ratio,
+                             args.error_rate).start()
+    # The predictors read these when they are created; the fake upstream must be set before importing them
+    os.environ['WEATHER_API_BASE_URL'] = upstream.base_url
+    os.environ['WEATHER_ARCHIVE_API_URL'] = upstream.archive_url
+    if SERVER_DIR not in sys.path:
+        sys.path.insert(0, SERVER_DIR)
+
+    # Predictors keep their state under ./data, so run in a scratch directory
+    workdir = tempfile.mkdtemp(prefix='weather-benchmark-')
+    previous_dir = os.getcwd()
+    os.chdir(workdir)
+    try:
+        predictor, startup = bench_startup(os.path.join('data', 'benchmark'))
+        results = {
+            'config': vars(args),
+            'startup': startup,
+            'training': bench_training(predictor, args.train_repeat),
+            'inference': bench_inference(predictor, args.repeat)
+        }
+        if not args.skip_api:
+            levels = [int(level) for level in args.concurrency.split(',')]
+            results['api'] = bench_api(levels, args.requests)
+        results['upstream_requests'] = dict(upstream.requests)
+    finally:
+        os.chdir(previous_dir)
+        shutil.rmtree(workdir, ignore_errors=True)
+        upstream.stop()
+
+    report(results)
+    if args.json == '-':
+        print(json.dumps(results, indent=2))
+    elif args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,13 @@
+# Gunicorn settings for multi-process deployment: gunicorn -c gunicorn.conf.py api:app
+# Set SHARED_STATE=true so the workers share one copy of each location's readings and models.
+import os
+
+bind = f"{os.getenv('FLASK_HOST', '0.0.0.0')}:{os.getenv('FLASK_PORT', 8080)}"
+workers = int(os.getenv('WEB_CONCURRENCY', 4))
+threads = int(os.getenv('WORKER_THREADS', 4))
+
+
+def post_worker_init(worker):
+    """Warm up and start ingestion in each worker; background threads do not survive a fork"""
+    import api
+    api.start_background_work()
@@ -0,0 +1,76 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from weather_service import success_body
+from ai_model.metrics import RESPONSE_CACHE_LOOKUPS
+
+
+def etag_matches(if_none_match, etag):
+    """Return True if an If-None-Match header value matches the (unquoted) ETag"""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate == '*':
+            return True
+        # Weak comparison, as required for If-None-Match
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate.strip('"') == etag:
+            return True
+    return False
+
+
+def cache_control(weather_predictor, interval):
+    """Cache-Control value letting clients reuse a response until the next reading is due"""
+    age = weather_predictor.reading_age()
+    max_age = max(0, int(interval - age)) if age is not None else 0
+    return f"public, max-age={max_age}"
+
+
+class ResponseCache:
+    """LRU cache of serialized success responses, keyed by location and data/model version.
+
+    Keys change whenever a new reading or model arrives, so entries never need invalidating; the TTL
+    only bounds how long a body computed at one time of day (e.g. a reading's age) is reused.
+    """
+    def __init__(self, ttl=None, max_entries=None):
+        self.ttl = ttl or int(os.getenv('INGEST_INTERVAL', 300))    # Seconds, aligned with the ingestion cadence
+        self.max_entries = max_entries or int(os.getenv('RESPONSE_CACHE_SIZE', 1024))
+        self._entries = OrderedDict()   # Key -> (expires_at, etag, body bytes), least recently used first
+        self._lock = threading.Lock()
+
+    def lookup(self, key, build):
+        """Return (etag, body) for key, calling build() for the response data on a miss.
+
+        An ApiError raised by build() propagates and is not cached.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                RESPONSE_CACHE_LOOKUPS.inc(result='hit')
+                return entry[1], entry[2]
+        RESPONSE_CACHE_LOOKUPS.inc(result='miss')
+
+        # Build outside the lock so one slow forecast does not hold up other locations
+        body = json.dumps(success_body(build()), separators=(',', ':')).encode()
+        etag = hashlib.sha1(body).hexdigest()[:20]
+        with self._lock:
+            self._entries[key] = (now + self.ttl, etag, body)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return etag, body
+
+    def collect_metrics(self):
+        """Metrics collector reporting the number of cached responses"""
+        return [('weather_response_cache_entries', 'gauge', 'Serialized responses held in the response cache',
+                 [({}, len(self))])]
+
+    def __len__(self):
+        return len(self._entries)
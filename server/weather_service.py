@@ -0,0 +1,283 @@
+import logging
+import os
+from datetime import datetime
+from ai_model.forecasting import (FORECAST_DAYS, FORECAST_FIELDS, HOURLY_FORECAST_HOURS, forecast_locations_columns,
+                                  forecast_records)
+from ai_model.metrics import PREDICTION_SECONDS
+
+MAX_FORECAST_DAYS = 16
+BATCH_LAYOUTS = ('records', 'columnar')
+MSGPACK_MIMETYPE = 'application/msgpack'
+AGE_RESOLUTION = 60     # Seconds; a cached current weather body reports the reading age to within this
+
+
+class ApiError(Exception):
+    """Error carrying the message and HTTP status code of an error response"""
+    def __init__(self, message, status_code=500):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+def error_body(message, status_code=500):
+    """Build the body of a consistent error response"""
+    return {
+        'success': False,
+        'error': {
+            'message': message,
+            'code': status_code
+        }
+    }
+
+
+def success_body(data, message=None):
+    """Build the body of a consistent success response"""
+    response = {
+        'success': True,
+        'data': data
+    }
+    if message:
+        response['message'] = message
+    return response
+
+
+def current_weather_key(weather_predictor, stale_after):
+    """Response cache key of the current weather payload.
+
+    Changes with every new reading, upstream health, the reading age (in AGE_RESOLUTION steps) and
+    staleness, so a cached body never reports an outdated age or a stale reading as fresh.
+    """
+    age = weather_predictor.reading_age()
+    return ('current-weather', weather_predictor.location_key, weather_predictor.store.version,
+            weather_predictor.client.guard.degraded,
+            int(age // AGE_RESOLUTION) if age is not None else None,
+            age is None or age > stale_after)
+
+
+def forecast_key(weather_predictor):
+    """Response cache key of the forecast payload; changes with new readings, a new model and the hour"""
+    model = weather_predictor.model_registry.current
+    return (
+        'weather-forecast',
+        weather_predictor.location_key,
+        weather_predictor.store.version,
+        model.version if model is not None else None,
+        datetime.now().strftime('%Y-%m-%d %H')     # Dates and the day/night spread depend on the hour
+    )
+
+
+def hourly_forecast_key(weather_predictor, hours):
+    """Response cache key of the hourly forecast payload; changes with new readings, a new model and the horizon"""
+    return forecast_key(weather_predictor) + (hours,)
+
+
+def parse_hours(hours):
+    """Validate the 'hours' query parameter of the hourly forecast"""
+    if hours is None:
+        return HOURLY_FORECAST_HOURS
+    try:
+        hours = int(hours)
+    except ValueError:
+        hours = 0
+    if not 1 <= hours <= HOURLY_FORECAST_HOURS:
+        raise ApiError(f"'hours' must be an integer between 1 and {HOURLY_FORECAST_HOURS}", 400)
+    return hours
+
+
+def current_weather_data(weather_predictor, stale_after):
+    """Build the current weather payload from the latest reading recorded by the ingestion scheduler"""
+    latest_reading = weather_predictor.store.latest()
+    if latest_reading is None:
+        raise ApiError('No weather data available yet', 404)
+
+    # Calculate sky condition based on the latest reading
+    temp = latest_reading['temperature']
+    humidity = latest_reading['humidity']
+    pressure = latest_reading['pressure']
+    sky_condition = weather_predictor.calculate_sky_condition(temp, humidity, pressure)
+    age = weather_predictor.reading_age()
+
+    return {
+        'temperature': temp,
+        'humidity': humidity,
+        'pressure': pressure,
+        'sky_condition': sky_condition,
+        'timestamp': latest_reading['created_at'],
+        'age_seconds': round(age, 1) if age is not None else None,
+        'stale': age is None or age > stale_after,
+        # True while Open-Meteo calls are failing and the last good reading is served instead
+        'upstream_degraded': weather_predictor.client.guard.degraded,
+        'location': weather_predictor.city
+    }
+
+
+def serving_model(weather_predictor):
+    """Return the model to forecast with; followers answer 503 until the owning process publishes one"""
+    model = weather_predictor.model_registry.get_latest()
+    if model is None:
+        if weather_predictor.is_follower():
+            raise ApiError('The weather prediction model is still being trained by another worker.', 503)
+        raise ApiError('Failed to train the weather prediction model.', 500)
+    return model
+
+
+def hourly_forecast_data(weather_predictor, hours=HOURLY_FORECAST_HOURS):
+    """Build the hourly forecast payload from the incrementally maintained lag features"""
+    if len(weather_predictor.store) < 240:
+        raise ApiError('Insufficient historical data for prediction. Need at least 240 readings.', 404)
+
+    model = serving_model(weather_predictor)
+
+    forecast = weather_predictor.predict_hourly_weather(model, hours)
+    if not forecast:
+        raise ApiError('Hourly forecast unavailable: needs 24 hours of recent readings and 10 days of history.', 404)
+
+    return {
+        'forecast': forecast,
+        'model_version': model.version,
+        'generated_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    }
+
+
+def readiness_data(weather_predictor):
+    """Build the readiness payload: data_ready once readings are served, model_ready once forecasts are"""
+    model = weather_predictor.model_registry.current
+    return {
+        'data_ready': weather_predictor.ready,
+        'model_ready': model is not None,
+        'model_version': model.version if model is not None else None,
+        'readings': len(weather_predictor.store),
+        'location': weather_predictor.city
+    }
+
+
+def forecast_data(weather_predictor):
+    """Build the 7-day forecast payload from the forecast materialized after the latest ingestion or training"""
+    # First ensure we have enough data and train the model
+    if len(weather_predictor.store) < 240:
+        raise ApiError('Insufficient historical data for prediction. Need at least 240 readings.', 404)
+
+    # Reuse the models trained on the current data; a retrain runs in the background when readings change
+    model = serving_model(weather_predictor)
+
+    # Usually a lookup; computed here only if the date or day/night half changed since the last update
+    materialized = weather_predictor.materialize_forecast(model)
+    if not materialized:
+        raise ApiError('Unable to generate forecast. Prediction failed.', 404)
+
+    # Log the forecast table only when debugging: this runs on every uncached request
+    weather_predictor._log_forecast(materialized['forecast'], logging.DEBUG)
+    return materialized
+
+
+def forecast_history_key(weather_predictor, limit):
+    """Response cache key of the forecast history payload; changes whenever a forecast is recorded"""
+    return ('forecast-history', weather_predictor.location_key, weather_predictor.forecast_history.version(), limit)
+
+
+def parse_limit(limit, maximum):
+    """Validate the 'limit' query parameter of the forecast history"""
+    if limit is None:
+        return min(24, maximum)
+    try:
+        limit = int(limit)
+    except ValueError:
+        limit = 0
+    if not 1 <= limit <= maximum:
+        raise ApiError(f"'limit' must be an integer between 1 and {maximum}", 400)
+    return limit
+
+
+def forecast_history_data(weather_predictor, limit):
+    """Build the forecast history payload: the latest materialized forecasts, newest first"""
+    return {
+        'forecasts': weather_predictor.forecast_history.recent(limit),
+        'location': weather_predictor.city
+    }
+
+
+def _parse_days(days, where):
+    """Validate a forecast horizon in days"""
+    if isinstance(days, bool) or not isinstance(days, int) or not 1 <= days <= MAX_FORECAST_DAYS:
+        raise ApiError(f"{where}: 'days' must be an integer between 1 and {MAX_FORECAST_DAYS}", 400)
+    return days
+
+
+def parse_batch_request(body, resolve):
+    """Validate a batch forecast request; returns (locations, horizons, layout).
+
+    The body looks like {"locations": [{"site": "delhi"}, {"lat": 28.6, "lon": 77.2, "days": 3}],
+    "days": 7, "layout": "records"}; per-location "days" override the request-wide one.
+    resolve is PredictorPool.resolve, used to reject invalid locations before any work is done.
+    """
+    if not isinstance(body, dict) or not isinstance(body.get('locations'), list) or not body['locations']:
+        raise ApiError("Request body must be a JSON object with a non-empty 'locations' list", 400)
+    max_locations = int(os.getenv('MAX_BATCH_LOCATIONS', 100))
+    if len(body['locations']) > max_locations:
+        raise ApiError(f'At most {max_locations} locations can be forecast per request', 400)
+    layout = body.get('layout', 'records')
+    if layout not in BATCH_LAYOUTS:
+        raise ApiError(f"'layout' must be one of {', '.join(BATCH_LAYOUTS)}", 400)
+    default_days = _parse_days(body.get('days', FORECAST_DAYS), 'Request')
+
+    locations = []
+    horizons = []
+    for index, entry in enumerate(body['locations']):
+        if not isinstance(entry, dict):
+            raise ApiError(f'Invalid location {index}: expected an object', 400)
+        location = {'site': entry.get('site'), 'latitude': entry.get('lat'), 'longitude': entry.get('lon')}
+        try:
+            resolve(**location)
+        except (TypeError, ValueError) as e:
+            raise ApiError(f'Invalid location {index}: {str(e)}', 400)
+        locations.append(location)
+        horizons.append(_parse_days(entry.get('days', default_days), f'Location {index}'))
+    return locations, horizons, layout
+
+
+def batch_forecast_data(weather_predictors, horizons, layout='records'):
+    """Build the batch forecast payload, predicting every location in one batched model pass.
+
+    The 'records' layout lists daily forecast dicts like /api/weather-forecast; 'columnar' sends one
+    array per field instead, with the dates given once, which is much smaller for many locations.
+    """
+    with PREDICTION_SECONDS.time(kind='batch'):
+        models, dates, arrays = forecast_locations_columns(weather_predictors, max(horizons))
+    columns = {field: values.tolist() for field, values in arrays.items()} if layout == 'records' else None
+
+    forecasts = []
+    for index, (weather_predictor, model, days) in enumerate(zip(weather_predictors, models, horizons)):
+        entry = {'location': weather_predictor.city}
+        if model is None:
+            entry['error'] = 'No forecast available for this location yet'
+        elif layout == 'columnar':
+            entry['model_version'] = model.version
+            entry['days'] = days
+            for field in FORECAST_FIELDS:
+                entry[field] = arrays[field][index, :days].tolist()
+        else:
+            entry['model_version'] = model.version
+            entry['forecast'] = forecast_records(dates[:days], columns, index)
+        forecasts.append(entry)
+
+    data = {
+        'forecasts': forecasts,
+        'generated_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    }
+    if layout == 'columnar':
+        data['dates'] = dates
+    return data
+
+
+def accepts_msgpack(accept):
+    """Return True if an Accept header asks for MessagePack"""
+    return bool(accept) and ('application/msgpack' in accept or 'application/x-msgpack' in accept)
+
+
+def msgpack_body(body):
+    """Encode a response body as MessagePack (optional dependency)"""
+    try:
+        import msgpack
+    except ImportError:
+        raise ApiError('MessagePack responses require the msgpack package on the server', 406)
+    return msgpack.packb(body, use_bin_type=True)